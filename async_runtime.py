@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import logging
+import network_3 as network
+import link_3 as link
+
+logger = logging.getLogger('async_runtime')
+
+## Stand-in for network.Notifier that wakes a coroutine instead of a thread.
+# notify() may be called from any thread, e.g. when the main thread calls
+# udt_send() or send_routes() while the event loop runs in the background.
+class AsyncNotifier:
+
+    ##@param runtime: AsyncRuntime whose event loop runs the waiting coroutine
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.event = asyncio.Event()
+        self.lock = threading.Lock() #notify() and wait() may run on different threads
+        self.ready_S = set()  # keys reported by notify() since the last wait()
+
+    ## mark key as ready and wake up the waiting coroutine
+    def notify(self, key):
+        with self.lock:
+            self.ready_S.add(key)
+        self.runtime.signal(self.event)
+
+    ## wake up the waiting coroutine without marking anything ready
+    def wake(self):
+        self.runtime.signal(self.event)
+
+    ## wait until some key is ready, wake() is called or timeout expires;
+    # always yields to the event loop, so busy nodes take turns
+    # @param timeout - seconds to wait, None to wait forever
+    # @return set of keys that became ready since the last call
+    async def wait(self, timeout=None):
+        if self.ready_S or self.event.is_set():
+            await asyncio.sleep(0)
+        else:
+            handle = None
+            if timeout is not None:
+                handle = asyncio.get_running_loop().call_later(timeout, self.event.set)
+            await self.event.wait()
+            if handle is not None:
+                handle.cancel()
+        self.event.clear()
+        with self.lock:
+            ready_S = self.ready_S
+            self.ready_S = set()
+        return ready_S
+
+
+## Runs Host, Router and LinkLayer logic as coroutines on one asyncio event
+# loop, replacing their threads. Interface queues stay as they are (nodes never
+# block on them); readiness and timers go through the event loop.
+class AsyncRuntime:
+
+    def __init__(self):
+        self.loop = None        # event loop running the nodes, set by start_thread() or run()
+        self.loop_thread = None # id of the thread running the loop
+        self.coroutine_L = []   # functions creating the node coroutines
+        self.notifier_L = []
+        self.stop = False
+
+    ## called when printing the object
+    def __str__(self):
+        return 'AsyncRuntime'
+
+    ## set an asyncio.Event from any thread
+    def signal(self, event):
+        if self.loop is None or threading.get_ident() == self.loop_thread:
+            event.set()
+        else:
+            self.loop.call_soon_threadsafe(event.set)
+
+    def add_objects(self, object_L):
+        for obj in object_L:
+            if isinstance(obj, network.Host):
+                self.add_host(obj)
+            elif isinstance(obj, network.Router):
+                self.add_router(obj)
+            elif isinstance(obj, link.LinkLayer):
+                self.add_link_layer(obj)
+
+    def new_notifier(self):
+        notifier = AsyncNotifier(self)
+        self.notifier_L.append(notifier)
+        return notifier
+
+    def add_host(self, host):
+        notifier = self.new_notifier()
+        host.intf_L[0].watch('in', notifier, 0)
+        self.coroutine_L.append(lambda: self.run_host(host, notifier))
+
+    def add_router(self, router):
+        notifier = self.new_notifier()
+        for i, intf in enumerate(router.intf_L):
+            intf.watch('in', notifier, i)
+        router.timer_listener = lambda r: notifier.wake() #recompute the wait timeout
+        router.block_on_full = False #a blocked put would stall the whole event loop
+        self.coroutine_L.append(lambda: self.run_router(router, notifier))
+
+    def add_link_layer(self, link_layer):
+        notifier = self.new_notifier()
+        for l in link_layer.link_L:
+            for d, (node_a, node_a_intf, _, _) in enumerate(l.dir_L):
+                node_a.intf_L[node_a_intf].watch('out', notifier, (l, d))
+        self.coroutine_L.append(lambda: self.run_link_layer(link_layer, notifier))
+
+    async def run_host(self, host, notifier):
+        while not self.stop:
+            await notifier.wait()
+            while host.udt_receive() is not None:
+                pass
+
+    async def run_router(self, router, notifier):
+        while not self.stop:
+            timeout = None
+            deadline = router.next_deadline()
+            if deadline is not None:
+                timeout = max(0, deadline - router.clock())
+            for i in await notifier.wait(timeout):
+                while router.process_interface(i):
+                    pass
+            router.check_timers()
+
+    async def run_link_layer(self, link_layer, notifier):
+        pending_S = set() #timed link directions with packets on the wire or waiting for the transmitter
+        while not self.stop:
+            ready_S = await notifier.wait(link_layer.pending_timeout(pending_S))
+            link_layer.serve(ready_S | pending_S, pending_S)
+
+    ## run every node until stop is set
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        logger.debug('%s: Starting %d nodes', self, len(self.coroutine_L))
+        await asyncio.gather(*[coroutine() for coroutine in self.coroutine_L])
+        logger.debug('%s: Ending', self)
+
+    ## run the event loop in a background thread, so the caller can keep using
+    # udt_send(), send_routes() and convergence.wait_for_convergence()
+    # @return the started thread
+    def start_thread(self):
+        #create the loop here, so notifications sent before the thread gets going are queued on it
+        self.loop = asyncio.new_event_loop()
+        t = threading.Thread(name=self.__str__(), target=self.run_loop)
+        t.start()
+        return t
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.run())
+        finally:
+            self.loop.close()
+
+    ## stop every node; safe to call from any thread
+    def shutdown(self):
+        self.stop = True
+        for notifier in self.notifier_L:
+            notifier.wake()
@@ -0,0 +1,108 @@
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+import event_sim
+import sim_logging
+import convergence
+import route_oracle
+import topology
+
+## Control plane scaling benchmark: build generated topologies of increasing
+# size, start distance-vector routing on every router at once and measure how
+# long the tables take to converge (in virtual time on the event engine).
+# Results are written as JSON, to a file if one is given on the command line.
+
+##configuration parameters
+timeout = 600           #virtual seconds before a run counts as not converged
+link_delay = 0.001      #link propagation delay in seconds
+burst_size = 16
+route_encoding = 'text' #'text' or 'binary' routing update messages
+incremental_updates = True
+refresh_interval = None #periodic refreshes only add noise to a convergence run
+coalesce_window = 0.005
+horizon_mode = 'poisoned_reverse'
+use_dv_matrix = False
+trace_memory = True     #track peak memory with tracemalloc (slows runs down)
+## (topology generator, its arguments) to run, smallest first; random graphs are seeded
+# so results stay comparable between runs
+topology_L = [('ring', {'n': 10}), ('ring', {'n': 20}), ('ring', {'n': 40}),
+              ('grid', {'rows': 3, 'cols': 3}), ('grid', {'rows': 5, 'cols': 5}), ('grid', {'rows': 8, 'cols': 8}),
+              ('fat_tree', {'k': 4}), ('fat_tree', {'k': 6}),
+              ('random_graph', {'n': 25, 'seed': 1}), ('random_graph', {'n': 50, 'seed': 1}),
+              ('random_graph', {'n': 100, 'seed': 1})]
+
+## run one topology to convergence
+# @return dict of measurements
+def run_topology(generator, args):
+    topo = getattr(topology, generator)(**args)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    object_L, node_D, link_layer = topology.build(topo,
+                                                  link_delay=link_delay,
+                                                  event_driven=True,
+                                                  pass_objects=True,
+                                                  burst_size=burst_size,
+                                                  route_encoding=route_encoding,
+                                                  incremental_updates=incremental_updates,
+                                                  refresh_interval=refresh_interval,
+                                                  coalesce_window=coalesce_window,
+                                                  horizon_mode=horizon_mode,
+                                                  use_dv_matrix=use_dv_matrix)
+    sim = event_sim.Simulator()
+    sim.add_objects(object_L)
+    build_time = time.perf_counter() - start
+    #every router advertises its table on every interface
+    for name in topo['routers']:
+        router = node_D[name]
+        for i in router.interface_list():
+            router.send_routes(i)
+    start = time.perf_counter()
+    converged, converge_time, messages = convergence.wait_for_convergence(object_L, sim, timeout)
+    run_time = time.perf_counter() - start
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'topology': generator,
+            'args': args,
+            'routers': len(topo['routers']),
+            'hosts': len(topo['hosts']),
+            'links': len(topo['links']),
+            'converged': converged,
+            'correct': not route_oracle.verify_routes(link_layer),
+            'convergence_time': converge_time,
+            'control_messages': messages,
+            'control_bytes': convergence.control_bytes(object_L),
+            'events': sim.event_count,
+            'build_seconds': build_time,
+            'wall_seconds': run_time,
+            'peak_memory_bytes': peak_memory}
+
+if __name__ == '__main__':
+    sim_logging.configure(logging.WARNING)
+    report = {'benchmark': 'control_plane',
+              'python': platform.python_version(),
+              'config': {'link_delay': link_delay,
+                         'burst_size': burst_size,
+                         'route_encoding': route_encoding,
+                         'incremental_updates': incremental_updates,
+                         'refresh_interval': refresh_interval,
+                         'coalesce_window': coalesce_window,
+                         'horizon_mode': horizon_mode,
+                         'use_dv_matrix': use_dv_matrix},
+              'results': []}
+    for generator, args in topology_L:
+        result = run_topology(generator, args)
+        report['results'].append(result)
+        print('%s %s: %d routers, converged=%s in %.3f s, %d messages, %d bytes' % \
+            (generator, args, result['routers'], result['converged'], result['convergence_time'],
+             result['control_messages'], result['control_bytes']), file=sys.stderr)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import event_sim
+import async_runtime
+import sim_logging
+import convergence
+import network_3 as network
+import route_oracle
+import topology
+
+## Data plane benchmark: once routes are in place, stream packets between host
+# pairs (Host.udt_send -> Link.tx_pkt -> Router.forward_packet) and report
+# throughput, end-to-end and per-hop latency percentiles and drops for each
+# topology and engine/transport mode. A hop runs from one node handing a packet
+# on (the source sending it, or a router forwarding it) to the next. Latencies are in virtual seconds on the
+# 'events' engine and wall clock seconds on the 'threads' and 'asyncio'
+# engines. Results are written as JSON, to a file if one is given on the
+# command line.
+
+##configuration parameters
+timeout = 600           #seconds before a run gives up waiting for delivery
+link_delay = 0.001      #link propagation delay in seconds (virtual time on the 'events' engine)
+link_bandwidth = None   #link transmission rate in bits per second, None to transmit instantly
+router_queue_size = 0   #0 means unlimited
+warm_start = True       #seed routes with shortest paths instead of running distance vector first
+packets_per_pair = 100  #packets sent from each source to its destination
+send_interval = 0       #seconds between consecutive packets of a pair, 0 sends them back to back
+max_pairs = 20          #host pairs used on topologies with more hosts (chosen with a fixed seed)
+## topology files and (generator, arguments) of generated topologies
+topology_L = [('file', {'path': 'topologies/simulation_1.json'}),
+              ('file', {'path': 'topologies/simulation_2.json'}),
+              ('file', {'path': 'topologies/simulation_3.json'}),
+              ('grid', {'rows': 5, 'cols': 5}),
+              ('fat_tree', {'k': 4})]
+## engine and transport modes to compare
+mode_L = [{'engine': 'events', 'pass_objects': True, 'burst_size': 16},
+          {'engine': 'events', 'pass_objects': True, 'burst_size': 16, 'queue_impl': 'ring'},
+          {'engine': 'events', 'pass_objects': False, 'burst_size': 1},
+          {'engine': 'threads', 'pass_objects': True, 'burst_size': 16},
+          {'engine': 'threads', 'pass_objects': True, 'burst_size': 16, 'queue_impl': 'ring'},
+          {'engine': 'threads', 'pass_objects': False, 'burst_size': 1},
+          {'engine': 'asyncio', 'pass_objects': True, 'burst_size': 16}]
+
+## nearest-rank percentile of a sorted list, None if it is empty
+def percentile(sorted_L, q):
+    if not sorted_L:
+        return None
+    return sorted_L[min(len(sorted_L) - 1, max(0, int(round(q / 100 * len(sorted_L))) - 1))]
+
+## summary statistics of a list of latencies
+def latency_summary(value_L):
+    value_L = sorted(value_L)
+    return {'p50': percentile(value_L, 50),
+            'p90': percentile(value_L, 90),
+            'p99': percentile(value_L, 99),
+            'max': value_L[-1] if value_L else None}
+
+## number of links a packet crosses from host src to dst, following the forwarding tables
+# @return None if some router has no route
+def path_hops(node_D, link_layer, src, dst):
+    peer_D = {}  # {(node name, interface): node at the other end}
+    for l in link_layer.link_L:
+        for (node_a, node_a_intf, node_b, node_b_intf) in l.dir_L:
+            peer_D[(str(node_a), node_a_intf)] = node_b
+    node = peer_D[(src, 0)]
+    hops = 1
+    while isinstance(node, network.Router):
+        intf = node.fib_D.get(dst)
+        if intf is None or hops > len(node_D):
+            return None
+        node = peer_D[(str(node), intf)]
+        hops += 1
+    return hops
+
+## host pairs to send between: all ordered pairs, or max_pairs of them
+def host_pairs(topo):
+    pair_L = [(a, b) for a in topo['hosts'] for b in topo['hosts'] if a != b]
+    if len(pair_L) > max_pairs:
+        pair_L = random.Random(1).sample(pair_L, max_pairs)
+    return pair_L
+
+## stream packets through one topology in one mode
+# @return dict of measurements
+def run_topology(topo, engine, pass_objects, burst_size, queue_impl='queue'):
+    object_L, node_D, link_layer = topology.build(topo,
+                                                  link_delay=link_delay,
+                                                  link_bandwidth=link_bandwidth,
+                                                  event_driven=True,
+                                                  pass_objects=pass_objects,
+                                                  burst_size=burst_size,
+                                                  max_queue_size=router_queue_size,
+                                                  queue_impl=queue_impl)
+    sim = None
+    runtime = None
+    thread_L = []
+    if engine == 'events':
+        sim = event_sim.Simulator()
+        sim.add_objects(object_L)
+        clock = sim.clock
+    elif engine == 'asyncio':
+        clock = time.perf_counter
+        runtime = async_runtime.AsyncRuntime()
+        runtime.add_objects(object_L)
+        thread_L.append(runtime.start_thread())
+    else:
+        clock = time.perf_counter
+        for obj in object_L:
+            thread_L.append(threading.Thread(name=obj.__str__(), target=obj.run))
+        for t in thread_L:
+            t.start()
+    #routes first
+    if warm_start:
+        route_oracle.seed_routes(link_layer)
+    else:
+        for name in topo['routers']:
+            for i in node_D[name].interface_list():
+                node_D[name].send_routes(i)
+        convergence.wait_for_convergence(object_L, sim, timeout)
+
+    #record when each packet was sent, forwarded and received
+    sent_D = {}      # {sequence number: (send time, source, destination)}
+    latency_D = {}   # {sequence number: end-to-end latency}
+    stamp_D = {}     # {sequence number: [send time, forwarding times..., receive time]}
+    finish_L = [None] #wall clock time of the last delivery
+    lock = threading.Lock()
+    def received(host, pkt):
+        if not isinstance(pkt, network.NetworkPacket):
+            pkt = network.NetworkPacket.from_byte_S(pkt)
+        if pkt.prot_S != 'data':
+            return
+        now = clock()
+        with lock:
+            seq = int(pkt.data_S[1:])
+            latency_D[seq] = now - sent_D[seq][0]
+            stamp_D[seq].append(now)
+            finish_L[0] = time.perf_counter()
+    def forwarded(router, pkt):
+        now = clock()
+        with lock:
+            stamp_D[int(pkt.data_S[1:])].append(now)
+    for name in topo['hosts']:
+        node_D[name].receive_listener = received
+    for name in topo['routers']:
+        node_D[name].forward_listener = forwarded
+    def send(seq, src, dst):
+        with lock:
+            sent_D[seq] = (clock(), src, dst)
+            stamp_D[seq] = [sent_D[seq][0]]
+        node_D[src].udt_send(dst, 'P%d' % seq)
+
+    pair_L = host_pairs(topo)
+    start = time.perf_counter()
+    seq = 0
+    for k in range(packets_per_pair):
+        for (src, dst) in pair_L:
+            if sim is not None:
+                sim.schedule(k * send_interval, send, seq, src, dst)
+            else:
+                send(seq, src, dst)
+            seq += 1
+        if sim is None and send_interval:
+            time.sleep(send_interval)
+    convergence.wait_for_convergence(object_L, sim, timeout) #wait for delivery
+    wall_time = (finish_L[0] or start) - start #leave out the quiet period the wait ends with
+    if sim is None:
+        for o in object_L:
+            o.stop = True
+        if runtime is not None:
+            runtime.shutdown()
+        for t in thread_L:
+            t.join()
+
+    hops_D = {pair: path_hops(node_D, link_layer, *pair) for pair in pair_L}
+    hop_latency_L = []
+    for seq in latency_D:
+        stamp_L = stamp_D[seq]
+        hop_latency_L.extend(stamp_L[k + 1] - stamp_L[k] for k in range(len(stamp_L) - 1))
+    delivered = len(latency_D)
+    forwarded = sum(hops_D[sent_D[seq][1:]] or 0 for seq in latency_D)
+    return {'routers': len(topo['routers']),
+            'hosts': len(topo['hosts']),
+            'pairs': len(pair_L),
+            'sent': len(sent_D),
+            'delivered': delivered,
+            'dropped': len(sent_D) - delivered,
+            'wall_seconds': wall_time,
+            'packets_per_second': delivered / wall_time if wall_time else None,
+            'hops_per_second': forwarded / wall_time if wall_time else None,
+            'latency': latency_summary(list(latency_D.values())),
+            'hop_latency': latency_summary(hop_latency_L),
+            'max_link_utilization': max([u for l in link_layer.link_L for u in l.stats()['utilization']], default=0)}
+
+if __name__ == '__main__':
+    sim_logging.configure(logging.WARNING)
+    report = {'benchmark': 'data_plane',
+              'python': platform.python_version(),
+              'config': {'link_delay': link_delay,
+                         'link_bandwidth': link_bandwidth,
+                         'router_queue_size': router_queue_size,
+                         'warm_start': warm_start,
+                         'packets_per_pair': packets_per_pair,
+                         'send_interval': send_interval},
+              'results': []}
+    for generator, args in topology_L:
+        if generator == 'file':
+            topo = topology.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), args['path']))
+        else:
+            topo = getattr(topology, generator)(**args)
+        for mode in mode_L:
+            result = run_topology(topo, **mode)
+            result.update({'topology': generator, 'args': args}, **mode)
+            report['results'].append(result)
+            print('%s %s %s: %d/%d delivered, %.0f packets/s, p50 latency %s' % \
+                (generator, args, mode, result['delivered'], result['sent'],
+                 result['packets_per_second'] or 0, result['latency']['p50']), file=sys.stderr)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
@@ -0,0 +1,80 @@
+import logging
+import os
+import random
+import sys
+import event_sim
+import sim_logging
+import convergence
+import dv_matrix
+import network_3 as network
+import route_oracle
+import topology
+
+## Reconvergence check: run distance-vector routing on the event engine, then
+# fail and restore links one at a time and compare every routing table with
+# the shortest paths after each change. Prints the mismatches and exits with
+# status 1 if there are any, so it can be run after changes to the routing code.
+
+##configuration parameters
+timeout = 60            #virtual seconds before a run counts as not converged
+link_delay = 0.001      #link propagation delay in seconds
+coalesce_window = 0.005
+links_per_topology = 5  #router links failed and restored per topology (chosen with a fixed seed)
+## topology files and (generator, arguments) of generated topologies, with further topology.build options
+topology_L = [('file', {'path': 'topologies/simulation_3.json'}, {}),
+              ('file', {'path': 'topologies/simulation_3.json'}, {'refresh_interval': 0.003}), #refreshes fall due before coalesced updates
+              ('random_graph', {'n': 15, 'seed': 0}, {}),
+              ('random_graph', {'n': 15, 'seed': 2}, {}),
+              ('grid', {'rows': 8, 'cols': 8}, {'link_mtu': 1500})] #full tables need several packets
+## router options to check; the distance matrix variants need numpy
+option_L = [{'horizon_mode': horizon_mode, 'use_dv_matrix': use_dv_matrix}
+            for horizon_mode in ('none', 'split_horizon', 'poisoned_reverse')
+            for use_dv_matrix in ((False, True) if dv_matrix.np is not None else (False,))]
+
+## run routing to convergence, then fail and restore links
+# @return list of error descriptions, empty if every table was right after every change
+def check(topo, options):
+    object_L, node_D, link_layer = topology.build(topo,
+                                                  link_delay=link_delay,
+                                                  event_driven=True,
+                                                  pass_objects=True,
+                                                  incremental_updates=True,
+                                                  coalesce_window=coalesce_window,
+                                                  **options)
+    sim = event_sim.Simulator()
+    sim.add_objects(object_L)
+    error_L = []
+    def settle(what):
+        converged, _, _ = convergence.wait_for_convergence(object_L, sim, timeout)
+        if not converged:
+            error_L.append('%s: not converged after %d s' % (what, timeout))
+        error_L.extend('%s: %s' % (what, e) for e in route_oracle.verify_routes(link_layer))
+    for name in topo['routers']:
+        for i in node_D[name].interface_list():
+            node_D[name].send_routes(i)
+    settle('start')
+    router_link_L = [l for l in link_layer.link_L
+                     if isinstance(l.node_1, network.Router) and isinstance(l.node_2, network.Router)]
+    for l in random.Random(1).sample(router_link_L, min(links_per_topology, len(router_link_L))):
+        link_layer.fail_link(l)
+        settle('after failing %s' % l)
+        link_layer.restore_link(l)
+        settle('after restoring %s' % l)
+    return error_L
+
+if __name__ == '__main__':
+    sim_logging.configure(logging.ERROR)
+    failed = False
+    for generator, args, build_options in topology_L:
+        if generator == 'file':
+            topo = topology.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), args['path']))
+        else:
+            topo = getattr(topology, generator)(**args)
+        for options in option_L:
+            options = dict(options, **build_options)
+            error_L = check(topo, options)
+            print('%s %s %s: %s' % (generator, args, options, '%d errors' % len(error_L) if error_L else 'ok'))
+            for e in error_L[:10]:
+                print('  ' + e)
+            failed = failed or bool(error_L)
+    sys.exit(1 if failed else 0)
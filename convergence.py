@@ -0,0 +1,70 @@
+import time
+import network_3 as network
+
+## True if no packets are waiting in any interface queue or on any link of the given objects
+def queues_empty(object_L):
+    for obj in object_L:
+        for intf in getattr(obj, 'intf_L', []):
+            if not intf.in_queue.empty() or not intf.out_queue.empty():
+                return False
+        for l in getattr(obj, 'link_L', []):
+            if l.in_flight():
+                return False
+    return True
+
+## True if some router is still holding back route changes
+def updates_pending(object_L):
+    return any(obj.has_pending_updates() for obj in object_L if isinstance(obj, network.Router))
+
+## total number of routing updates sent by the routers in object_L
+def control_messages(object_L):
+    return sum(obj.ctrl_sent_count for obj in object_L if isinstance(obj, network.Router))
+
+## total RouteMessage payload bytes sent by the routers in object_L
+def control_bytes(object_L):
+    return sum(obj.ctrl_sent_bytes for obj in object_L if isinstance(obj, network.Router))
+
+## wait until the network is quiet: no packets are queued on any interface
+# and routers have stopped sending (or holding back) routing updates. Call it right after
+# starting the routing process (or sending data) to replace a fixed sleep.
+# @param object_L: hosts, routers and link layers of the network
+# @param sim: event_sim.Simulator driving the objects, None if they run in threads
+# @param timeout: give up after this many (wall clock or virtual) seconds
+# @param settle_time: seconds the network must stay quiet (threads only)
+# @param poll_interval: seconds between checks (threads only)
+# @return (converged, seconds until the last activity, routing updates sent meanwhile)
+def wait_for_convergence(object_L, sim=None, timeout=60, settle_time=0.05, poll_interval=0.005):
+    start_messages = control_messages(object_L)
+    if sim is not None:
+        #the simulation is quiet when only timer events are left and no router holds back route changes
+        start = sim.now
+        while True:
+            sim.run(until=start + timeout, until_quiet=True)
+            if not updates_pending(object_L) or not sim.event_L or sim.event_L[0][0] > start + timeout:
+                break
+            sim.run(until=sim.event_L[0][0]) #run the next timer
+        converged = not sim.busy_count and not updates_pending(object_L)
+        return converged, sim.now - start, control_messages(object_L) - start_messages
+
+    start = time.monotonic()
+    last_active = start
+    last_messages = start_messages
+    while True:
+        now = time.monotonic()
+        messages = control_messages(object_L)
+        if messages != last_messages or not queues_empty(object_L) or updates_pending(object_L):
+            last_messages = messages
+            last_active = now
+        elif now - last_active >= settle_time:
+            return True, last_active - start, messages - start_messages
+        if now - start >= timeout:
+            return False, now - start, messages - start_messages
+        time.sleep(poll_interval)
+
+## apply a change to the network (e.g. fail a link) and measure how long
+# routing takes to reconverge
+# @param action: function making the change
+# @return same as wait_for_convergence, timed from the change
+def measure_reconvergence(object_L, action, sim=None, timeout=60):
+    action()
+    return wait_for_convergence(object_L, sim, timeout)
@@ -0,0 +1,106 @@
+try:
+    import numpy as np
+except ImportError: #numpy is optional, only needed when a router uses DistanceMatrix
+    np = None
+
+## Distance-vector state of one router held in NumPy arrays: one row per
+# destination and one column per interface, holding the cost the neighbor
+# on that interface advertised. A received vector is applied with a single
+# vectorized Bellman-Ford relaxation min(link cost + advertised cost).
+class DistanceMatrix:
+
+    ##@param router: network_3.Router whose neighbor index and routing table seed the matrix
+    def __init__(self, router):
+        if np is None:
+            raise Exception('%s: the distance matrix needs numpy' % router)
+        self.router = router
+        self.infinity = router.infinity
+        n_intf = len(router.intf_L)
+        self.dest_D = {}        # {destination: row}
+        self.dest_L = []        # row -> destination
+        self.vec_A = np.full((16, n_intf), self.infinity, dtype=np.int64) # advertised costs
+        self.via_A = np.full(16, -1, dtype=np.int64)          # interface of the chosen route, -1 if none
+        self.cost_A = np.full(16, self.infinity, dtype=np.int64) # cost of the chosen route
+        self.link_A = np.full(n_intf, self.infinity, dtype=np.int64) # link cost per interface
+        for intf in range(n_intf):
+            self.update_link(intf)
+        #a neighbor is at distance 0 from itself, even if it never advertises (hosts)
+        for neighbor, intf in router.nbr_intf_D.items():
+            self.vec_A[self.row_of(neighbor), intf] = 0
+        for dest, route_D in router.rt_tbl_D.items():
+            if dest == router.name:
+                continue
+            (via, cost) = min(route_D.items(), key=lambda item: item[1])
+            row = self.row_of(dest)
+            self.via_A[row] = self.column_of(dest, via)
+            self.cost_A[row] = cost
+
+    ## row of a destination, adding (and growing the arrays) if it is new
+    def row_of(self, dest):
+        row = self.dest_D.get(dest)
+        if row is None:
+            row = len(self.dest_L)
+            if row == len(self.via_A):
+                self.vec_A = np.vstack([self.vec_A, np.full_like(self.vec_A, self.infinity)])
+                self.via_A = np.concatenate([self.via_A, np.full_like(self.via_A, -1)])
+                self.cost_A = np.concatenate([self.cost_A, np.full_like(self.cost_A, self.infinity)])
+            self.dest_D[dest] = row
+            self.dest_L.append(dest)
+        return row
+
+    ## interface used to reach dest through next hop via
+    def column_of(self, dest, via):
+        return self.router.nbr_intf_D[dest if via == self.router.name else via]
+
+    ## refresh the cost of the link on interface i from the router
+    def update_link(self, i):
+        if i in self.router.down_S or self.router.intf_nbr_L[i] is None:
+            self.link_A[i] = self.infinity
+        else:
+            self.link_A[i] = self.router.intf_cost_A[i]
+
+    ## drop the vector learned on interface i, e.g. after its link failed
+    def forget(self, i):
+        self.vec_A[:, i] = self.infinity
+        neighbor = self.router.intf_nbr_L[i]
+        if neighbor is not None:
+            self.vec_A[self.row_of(neighbor), i] = 0
+
+    ## store the vector received on interface i and relax the rows it touched
+    # @param routes: {destination: {router: cost}} as parsed by RouteMessage
+    # @return list of changed routes as (destination, next hop, cost)
+    def apply(self, i, routes):
+        own = self.router.name
+        dest_L = [dest for dest in routes if dest != own]
+        rows = np.fromiter((self.row_of(dest) for dest in dest_L), dtype=np.int64, count=len(dest_L))
+        costs = np.fromiter((min(routes[dest].values()) for dest in dest_L), dtype=np.int64, count=len(dest_L))
+        self.vec_A[rows, i] = np.minimum(costs, self.infinity)
+        return self.relax(rows)
+
+    ## relax every destination, e.g. after a link changed
+    def relax_all(self):
+        return self.relax(np.arange(len(self.dest_L)))
+
+    ## pick the cheapest interface for the given rows; the current next hop wins ties
+    # @return list of changed routes as (destination, next hop, cost)
+    def relax(self, rows):
+        k = np.arange(len(rows))
+        cand_A = np.minimum(self.vec_A[rows] + self.link_A, self.infinity)
+        best_col = cand_A.argmin(axis=1)
+        best_cost = cand_A[k, best_col]
+        cur_col = self.via_A[rows]
+        has_cur = cur_col >= 0
+        cur_cost = np.where(has_cur, cand_A[k, np.maximum(cur_col, 0)], self.infinity)
+        keep = has_cur & (cur_cost <= best_cost)
+        new_col = np.where(keep, cur_col, np.where(best_cost < self.infinity, best_col, -1))
+        new_cost = np.where(keep, cur_cost, best_cost)
+        changed = (new_col != cur_col) | (new_cost != self.cost_A[rows])
+        self.via_A[rows] = new_col
+        self.cost_A[rows] = new_cost
+        change_L = []
+        for j in np.nonzero(changed)[0]:
+            dest = self.dest_L[rows[j]]
+            neighbor = self.router.intf_nbr_L[new_col[j]]
+            via = self.router.name if neighbor == dest else neighbor
+            change_L.append((dest, via, int(new_cost[j])))
+        return change_L
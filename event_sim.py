@@ -0,0 +1,159 @@
+import heapq
+import itertools
+import network_3 as network
+import link_3 as link
+
+## Stand-in for network.Notifier that turns "packet enqueued" notifications
+# into events on a Simulator instead of waking a thread
+class EventNotifier:
+
+    ##@param sim: Simulator to schedule events on
+    # @param handler: callback invoked with the notified key
+    # @param delay_F: function of the key giving the event delay in virtual seconds
+    def __init__(self, sim, handler, delay_F):
+        self.sim = sim
+        self.handler = handler
+        self.delay_F = delay_F
+
+    def notify(self, key):
+        self.sim.schedule(self.delay_F(key), self.handler, key)
+
+
+## Single-threaded discrete-event scheduler that runs Host, Router, Link and
+# LinkLayer logic in virtual time, replacing their threads
+class Simulator:
+
+    ##@param processing_delay: virtual seconds between a packet arriving at a
+    # node and the node processing it
+    def __init__(self, processing_delay=0):
+        self.now = 0            # current virtual time in seconds
+        self.event_L = []       # heap of (time, sequence number, busy, callback, args)
+        self.seq = itertools.count() #tie breaker, keeps same-time events in FIFO order
+        self.processing_delay = processing_delay
+        self.event_count = 0    # number of events run so far
+        self.busy_count = 0     # scheduled events that keep the network busy (not timers)
+        self.timer_D = {}       # {router: (deadline, busy) of its scheduled timer event}
+        self.link_timer_D = {}  # {(timed link, direction): deadline of its scheduled event}
+
+    ## called when printing the object
+    def __str__(self):
+        return 'Simulator'
+
+    ## current virtual time; handed to routers as their clock
+    def clock(self):
+        return self.now
+
+    ## schedule callback(*args) to run delay virtual seconds from now
+    # @param busy: False for timer events, which do not count as network activity
+    def schedule(self, delay, callback, *args, busy=True):
+        heapq.heappush(self.event_L, (self.now + delay, next(self.seq), busy, callback, args))
+        if busy:
+            self.busy_count += 1
+
+    ## take over the objects that would otherwise run in their own threads
+    # @param object_L: hosts, routers and link layers of the network
+    def add_objects(self, object_L):
+        for obj in object_L:
+            if isinstance(obj, network.Host):
+                self.add_host(obj)
+            elif isinstance(obj, network.Router):
+                self.add_router(obj)
+            elif isinstance(obj, link.LinkLayer):
+                self.add_link_layer(obj)
+
+    def add_host(self, host):
+        notifier = EventNotifier(self, lambda i: self.drain_host(host), self.node_delay)
+        host.intf_L[0].watch('in', notifier, 0)
+
+    def add_router(self, router):
+        notifier = EventNotifier(self, lambda i: self.drain_router(router, i), self.node_delay)
+        for i, intf in enumerate(router.intf_L):
+            intf.watch('in', notifier, i)
+        router.set_clock(self.clock)
+        router.timer_listener = self.arm_timer
+        router.block_on_full = False #a blocked put would stall the whole simulation
+        self.arm_timer(router)
+
+    def add_link_layer(self, link_layer):
+        for l in link_layer.link_L:
+            self.add_link(l)
+
+    ## every packet put into an out queue of the link schedules one
+    # transmission; a timed link (see link.Link.tx_timed) runs on the virtual
+    # clock and schedules its own events for arrivals and a free transmitter
+    def add_link(self, l):
+        if l.timed:
+            l.set_clock(self.clock)
+            notifier = EventNotifier(self, lambda d: self.run_link(l, d), lambda d: 0)
+        else:
+            notifier = EventNotifier(self, lambda d: l.tx_dir(d), lambda d: l.delay)
+        for d, (node_a, node_a_intf, _, _) in enumerate(l.dir_L):
+            node_a.intf_L[node_a_intf].watch('out', notifier, d)
+
+    def node_delay(self, key):
+        return self.processing_delay
+
+    def drain_host(self, host):
+        while host.udt_receive() is not None:
+            pass
+
+    def drain_router(self, router, i):
+        while router.process_interface(i):
+            pass
+        self.arm_timer(router)
+
+    ## make sure an event is scheduled for the router's next timer deadline;
+    # it counts as network activity while the router holds back route changes,
+    # so an event armed before the changes came along is replaced by a busy one
+    def arm_timer(self, router):
+        deadline = router.next_deadline()
+        if deadline is None:
+            return
+        armed = (deadline, router.has_pending_updates())
+        current = self.timer_D.get(router)
+        if current is None or current[0] != deadline or (armed[1] and not current[1]):
+            self.timer_D[router] = armed
+            self.schedule(max(0, deadline - self.now), self.fire_timer, router, armed, busy=armed[1])
+
+    def fire_timer(self, router, armed):
+        if self.timer_D.get(router) != armed:
+            return #superseded by a timer armed later
+        del self.timer_D[router]
+        router.check_timers()
+        self.arm_timer(router)
+
+    ## move what can go now across a timed link direction and schedule its next visit
+    def run_link(self, l, d):
+        while l.tx_dir(d):
+            pass
+        deadline = l.next_deadline(d)
+        if deadline is not None and deadline != self.link_timer_D.get((l, d)):
+            self.link_timer_D[(l, d)] = deadline
+            self.schedule(max(0, deadline - self.now), self.fire_link, l, d, deadline)
+
+    def fire_link(self, l, d, deadline):
+        if self.link_timer_D.get((l, d)) != deadline:
+            return #superseded by an event scheduled later
+        del self.link_timer_D[(l, d)]
+        self.run_link(l, d)
+
+    ## run events in timestamp order
+    # @param until: virtual time to stop at, None to run until no events are left;
+    # if the network goes idle first the clock stays at the last event
+    # @param until_quiet: also stop once only timer events are left
+    # @return number of events run
+    def run(self, until=None, until_quiet=False):
+        count = 0
+        while self.event_L:
+            if until_quiet and not self.busy_count:
+                break
+            if until is not None and self.event_L[0][0] > until:
+                self.now = until
+                break
+            (self.now, _, busy, callback, args) = heapq.heappop(self.event_L)
+            if busy:
+                self.busy_count -= 1
+            callback(*args)
+            count += 1
+        self.event_count += count
+        return count
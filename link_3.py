@@ -1,5 +1,10 @@
-import queue
 import threading
+import logging
+import collections
+import time
+from network_3 import Notifier, NetworkPacket
+
+logger = logging.getLogger('link')
 
 ## An abstraction of a link between router interfaces
 class Link:
@@ -9,66 +14,363 @@ class Link:
     # @param node_1_intf: number of the interface on that node
     # @param node_2: node to which data will be transfered
     # @param node_2_intf: number of the interface on that node
-    def __init__(self, node_1, node_1_intf, node_2, node_2_intf):
+    # @param delay: propagation delay in seconds
+    # @param bandwidth: transmission rate in bits per second, None to transmit instantly
+    # @param mtu: largest packet in bytes, None for no limit; larger packets are dropped
+    def __init__(self, node_1, node_1_intf, node_2, node_2_intf, delay=0, bandwidth=None, mtu=None):
         self.node_1 = node_1
         self.node_1_intf = node_1_intf
         self.node_2 = node_2
         self.node_2_intf = node_2_intf
-        print('Created link %s' % self.__str__())
+        self.delay = delay
+        self.bandwidth = bandwidth
+        self.mtu = mtu
+        #let the routers size their routing updates to fit
+        node_1.intf_L[node_1_intf].mtu = mtu
+        node_2.intf_L[node_2_intf].mtu = mtu
+        #packets take time to cross the link, see tx_timed()
+        self.timed = delay > 0 or bandwidth is not None
+        self.up = True #packets sent over a failed link are lost
+        self.tx_count = 0   #packets delivered to the far end
+        self.lost_count = 0 #packets lost because the link was down, too large or the far queue was full
+        self.mtu_drop_count = 0 #packets dropped for exceeding the MTU
+        #the two transmission directions as (node_a, node_a_intf, node_b, node_b_intf)
+        self.dir_L = [(node_1, node_1_intf, node_2, node_2_intf),
+                      (node_2, node_2_intf, node_1, node_1_intf)]
+        #per direction: packets on the wire as (arrival time, packet), and seconds spent transmitting
+        self.flight_L = [collections.deque(), collections.deque()]
+        self.busy_time_L = [0.0, 0.0]
+        self.set_clock(time.monotonic)
+        logger.debug('Created link %s', self)
 
     ## called when printing the object
     def __str__(self):
         return 'Link %s-%d - %s-%d' % (self.node_1, self.node_1_intf, self.node_2, self.node_2_intf)
 
-    ##transmit a packet between interfaces in each direction
-    def tx_pkt(self):
-        for (node_a, node_a_intf, node_b, node_b_intf) in \
-        [(self.node_1, self.node_1_intf, self.node_2, self.node_2_intf),
-         (self.node_2, self.node_2_intf, self.node_1, self.node_1_intf)]:
-            intf_a = node_a.intf_L[node_a_intf]
-            intf_b = node_b.intf_L[node_b_intf]
-            pkt_S = intf_a.get('out')
-            if pkt_S is None:
-                continue #continue if no packet to transfer
-            #otherwise transmit the packet
-            try:
-                intf_b.put(pkt_S, 'in')
-                print('%s: direction %s-%s -> %s-%s: transmitting packet "%s"' % \
-                    (self, node_a, node_a_intf, node_b, node_b_intf, pkt_S))
-            except queue.Full:
-                print('%s: direction %s-%s -> %s-%s: packet lost' % \
-                    (self, node_a, node_a_intf, node_b, node_b_intf))
-                pass
+    ## use a different time source, e.g. a simulator's virtual clock
+    def set_clock(self, clock):
+        self.clock = clock
+        self.start_time = clock()
+        #per direction, when the transmitter finishes the packet it is sending
+        self.busy_until_L = [self.start_time, self.start_time]
+
+    ## link counters; utilization is the fraction of time each direction spent transmitting
+    def stats(self):
+        return {'transmitted': self.tx_count,
+                'lost': self.lost_count,
+                'mtu_dropped': self.mtu_drop_count,
+                'in_flight': len(self.flight_L[0]) + len(self.flight_L[1]),
+                'utilization': [self.utilization(0), self.utilization(1)],
+                'up': self.up}
+
+    ## fraction of the time since the clock was set that direction d spent transmitting
+    def utilization(self, d):
+        elapsed = self.clock() - self.start_time
+        if elapsed <= 0:
+            return 0.0
+        return min(1.0, self.busy_time_L[d] / elapsed)
+
+    ## True if packets are on the wire in either direction
+    def in_flight(self):
+        return bool(self.flight_L[0] or self.flight_L[1])
+
+    ## when direction d next has something to do: a packet arriving or the
+    # transmitter becoming free for a waiting packet
+    # @return time on this link's clock, None if nothing is pending
+    def next_deadline(self, d):
+        deadline = None
+        if self.flight_L[d]:
+            deadline = self.flight_L[d][0][0]
+        (node_a, node_a_intf, _, _) = self.dir_L[d]
+        if not node_a.intf_L[node_a_intf].out_queue.empty():
+            busy_until = self.busy_until_L[d]
+            deadline = busy_until if deadline is None else min(deadline, busy_until)
+        return deadline
+
+    ## size of a packet on the wire in bytes
+    @staticmethod
+    def packet_size(pkt):
+        return len(pkt.to_byte_S() if isinstance(pkt, NetworkPacket) else pkt)
+
+    ##transmit packets between interfaces in each direction
+    # @param burst_size: max packets moved per direction
+    # @return number of packets taken off the out queues
+    def tx_pkt(self, burst_size=1):
+        return self.tx_dir(0, burst_size) + self.tx_dir(1, burst_size)
+
+    ##transmit a burst of packets in one direction
+    # @param d: index into dir_L (0 for node_1 -> node_2, 1 for node_2 -> node_1)
+    # @param burst_size: max packets moved
+    # @return number of packets taken off the out queue (or, on a timed link, also delivered)
+    def tx_dir(self, d, burst_size=1):
+        if self.timed:
+            return self.tx_timed(d, burst_size)
+        (node_a, node_a_intf, node_b, node_b_intf) = self.dir_L[d]
+        pkt_L = node_a.intf_L[node_a_intf].get_many('out', burst_size)
+        if not pkt_L:
+            return 0 #nothing to transfer
+        n = len(pkt_L)
+        if self.mtu is not None:
+            pkt_L = self.drop_oversize(d, pkt_L)
+        self.deliver(d, pkt_L)
+        return n
+
+    ##transmit in one direction of a timed link: deliver the packets whose last
+    # bit has arrived, then start sending waiting packets while the transmitter
+    # is free. A packet occupies the transmitter for size * 8 / bandwidth seconds
+    # and arrives delay seconds after it is sent; the out queue holds the rest.
+    # @return number of packets delivered or taken off the out queue
+    def tx_timed(self, d, burst_size=1):
+        now = self.clock()
+        flight = self.flight_L[d]
+        count = 0
+        if flight and flight[0][0] <= now:
+            arrived_L = []
+            while flight and flight[0][0] <= now:
+                arrived_L.append(flight.popleft()[1])
+            self.deliver(d, arrived_L)
+            count += len(arrived_L)
+        (node_a, node_a_intf, _, _) = self.dir_L[d]
+        intf_a = node_a.intf_L[node_a_intf]
+        sent = 0
+        while sent < burst_size and self.busy_until_L[d] <= now:
+            pkt_L = intf_a.get_many('out', 1)
+            if not pkt_L:
+                break
+            sent += 1
+            if not self.up:
+                self.deliver(d, pkt_L) #lost
+                continue
+            if self.mtu is not None and not self.drop_oversize(d, pkt_L):
+                continue
+            tx_time = 0
+            if self.bandwidth is not None:
+                tx_time = self.packet_size(pkt_L[0]) * 8 / self.bandwidth
+                self.busy_until_L[d] = now + tx_time
+                self.busy_time_L[d] += tx_time
+            flight.append((now + tx_time + self.delay, pkt_L[0]))
+        return count + sent
+
+    ## drop packets larger than the MTU
+    # @return the packets that fit
+    def drop_oversize(self, d, pkt_L):
+        fit_L = [pkt for pkt in pkt_L if self.packet_size(pkt) <= self.mtu]
+        if len(fit_L) < len(pkt_L):
+            (node_a, node_a_intf, node_b, node_b_intf) = self.dir_L[d]
+            self.mtu_drop_count += len(pkt_L) - len(fit_L)
+            self.lost_count += len(pkt_L) - len(fit_L)
+            for pkt_S in pkt_L:
+                if self.packet_size(pkt_S) > self.mtu:
+                    logger.warning('%s: direction %s-%s -> %s-%s: packet larger than MTU %d, packet lost',
+                                   self, node_a, node_a_intf, node_b, node_b_intf, self.mtu)
+        return fit_L
+
+    ## put packets into the in queue at the far end of direction d;
+    # those that do not fit, or cross a failed link, are lost
+    def deliver(self, d, pkt_L):
+        if not pkt_L:
+            return
+        (node_a, node_a_intf, node_b, node_b_intf) = self.dir_L[d]
+        if not self.up:
+            self.lost_count += len(pkt_L)
+            if logger.isEnabledFor(logging.WARNING):
+                for pkt_S in pkt_L:
+                    logger.warning('%s: direction %s-%s -> %s-%s: link down, packet lost',
+                                   self, node_a, node_a_intf, node_b, node_b_intf)
+            return
+        n = node_b.intf_L[node_b_intf].put_many(pkt_L, 'in')
+        self.tx_count += n
+        self.lost_count += len(pkt_L) - n
+        if logger.isEnabledFor(logging.DEBUG):
+            for pkt_S in pkt_L[:n]:
+                logger.debug('%s: direction %s-%s -> %s-%s: transmitting packet "%s"',
+                             self, node_a, node_a_intf, node_b, node_b_intf, pkt_S)
+        for pkt_S in pkt_L[n:]:
+            logger.warning('%s: direction %s-%s -> %s-%s: packet lost',
+                           self, node_a, node_a_intf, node_b, node_b_intf)
+
+
+## Notifier stand-in for a polling link layer: records which link directions
+# had packets enqueued, so a sweep only visits those instead of every link
+class ActiveSet:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ready_S = set()  # keys reported by notify() since the last wait()
+
+    def notify(self, key):
+        with self.lock:
+            self.ready_S.add(key)
+
+    def wake(self):
+        pass #a polling thread never sleeps
+
+    ## never blocks
+    # @return set of keys that became ready since the last call
+    def wait(self, timeout=None):
+        with self.lock:
+            ready_S = self.ready_S
+            self.ready_S = set()
+            return ready_S
 
 
 ## An abstraction of the link layer
 class LinkLayer:
 
-    def __init__(self):
+    ##@param event_driven: if True the thread sleeps until a node enqueues
+    # a packet for transmission instead of polling
+    # @param burst_size: max packets moved per link direction per visit
+    # @param n_workers: number of threads moving packets; links are spread
+    # over them round robin, each thread serving its own links
+    def __init__(self, event_driven=False, burst_size=1, n_workers=1):
         ## list of links in the network
         self.link_L = []
+        self.burst_size = burst_size
+        self.event_driven = event_driven
+        self.n_workers = n_workers
+        #per worker, the link directions with packets waiting, as (link, direction) keys
+        self.watcher_L = [Notifier() if event_driven else ActiveSet() for _ in range(n_workers)]
+        #per worker, the directions of timed links with packets on the wire or waiting for the transmitter
+        self.pending_L = [set() for _ in range(n_workers)]
         self.stop = False #for thread termination
 
     ## called when printing the object
     def __str__(self):
         return 'Network'
 
+    ## thread termination flag; setting it wakes up an event-driven thread
+    @property
+    def stop(self):
+        return self._stop
+
+    @stop.setter
+    def stop(self, value):
+        self._stop = value
+        if value:
+            for watcher in self.watcher_L:
+                watcher.wake()
+
     ##add a Link to the network
     def add_link(self, link):
+        watcher = self.watcher_L[len(self.link_L) % self.n_workers]
         self.link_L.append(link)
+        #get told which link direction has packets waiting
+        for d, (node_a, node_a_intf, _, _) in enumerate(link.dir_L):
+            node_a.intf_L[node_a_intf].watch('out', watcher, (link, d))
+
+    ##links attached to a node
+    def links_of(self, node):
+        return [link for link in self.link_L if node is link.node_1 or node is link.node_2]
+
+    ##take a link down and tell the routers at both ends
+    def fail_link(self, link):
+        logger.info('%s: failing %s', self, link)
+        link.up = False
+        for (node, node_intf, _, _) in link.dir_L:
+            if hasattr(node, 'link_down'):
+                node.link_down(node_intf)
+
+    ##bring a failed link back up and tell the routers at both ends
+    def restore_link(self, link):
+        logger.info('%s: restoring %s', self, link)
+        link.up = True
+        for (node, node_intf, _, _) in link.dir_L:
+            if hasattr(node, 'link_up'):
+                node.link_up(node_intf)
 
-    ##transfer a packet across all links
+    ##change the cost of a link as seen by the routers at both ends
+    # @param cost_1: cost from node_1's side
+    # @param cost_2: cost from node_2's side, defaults to cost_1
+    def set_link_cost(self, link, cost_1, cost_2=None):
+        if cost_2 is None:
+            cost_2 = cost_1
+        for (node, node_intf, _, _), cost in zip(link.dir_L, (cost_1, cost_2)):
+            if hasattr(node, 'set_link_cost'):
+                node.set_link_cost(node_intf, cost)
+
+    ##fail every link attached to a node, e.g. to simulate a router crash
+    def fail_node(self, node):
+        for link in self.links_of(node):
+            if link.up:
+                self.fail_link(link)
+
+    ##restore every link attached to a node
+    def restore_node(self, node):
+        for link in self.links_of(node):
+            if not link.up:
+                self.restore_link(link)
+
+    ##transfer a burst of packets across all links with packets waiting
     def transfer(self):
-        for link in self.link_L:
-            link.tx_pkt()
+        for k in range(self.n_workers):
+            self.transfer_shard(k)
+
+    ##transfer a burst of packets across the links of worker k with packets waiting
+    def transfer_shard(self, k):
+        pending_S = self.pending_L[k]
+        self.serve(self.watcher_L[k].wait() | pending_S, pending_S, drain=False, watcher=self.watcher_L[k])
 
-    ## thread target for the network to keep transmitting data across links
+    ##move packets across the given link directions
+    # @param key_S: (link, direction) keys to visit
+    # @param pending_S: updated with the timed link directions that still have work
+    #  at a later time, see pending_timeout()
+    # @param drain: if True move packets until none can go now, otherwise one burst
+    # @param watcher: notified of untimed directions left with packets after a burst
+    def serve(self, key_S, pending_S, drain=True, watcher=None):
+        for link, d in key_S:
+            if drain:
+                while link.tx_dir(d, self.burst_size):
+                    pass
+            else:
+                link.tx_dir(d, self.burst_size)
+            if link.timed:
+                if link.next_deadline(d) is None:
+                    pending_S.discard((link, d))
+                else:
+                    pending_S.add((link, d))
+            elif not drain:
+                (node_a, node_a_intf, _, _) = link.dir_L[d]
+                if not node_a.intf_L[node_a_intf].out_queue.empty():
+                    watcher.notify((link, d)) #more than a burst was waiting, visit again next time
+
+    ##seconds until the first of the pending timed link directions has work, None if there is none
+    @staticmethod
+    def pending_timeout(pending_S):
+        timeout = None
+        for link, d in pending_S:
+            deadline = link.next_deadline(d)
+            if deadline is not None:
+                wait = max(0, deadline - link.clock())
+                if timeout is None or wait < timeout:
+                    timeout = wait
+        return timeout
+
+    ## thread target for the network to keep transmitting data across links;
+    # starts a thread for every other worker and serves worker 0 itself
     def run(self):
-        print (threading.currentThread().getName() + ': Starting')
+        logger.debug('%s: Starting', threading.current_thread().name)
+        thread_L = [threading.Thread(name='%s-%d' % (threading.current_thread().name, k),
+                                     target=self.run_shard, args=(k,))
+                    for k in range(1, self.n_workers)]
+        for t in thread_L:
+            t.start()
+        self.run_shard(0)
+        for t in thread_L:
+            t.join()
+        logger.debug('%s: Ending', threading.current_thread().name)
+
+    ## move packets across the links of worker k until stop is set
+    def run_shard(self, k):
+        watcher = self.watcher_L[k]
+        pending_S = self.pending_L[k]
         while True:
-            #transfer one packet on all the links
-            self.transfer()
+            if self.event_driven:
+                #sleep until packets are enqueued or a timed link has packets due,
+                #then drain only those directions
+                ready_S = watcher.wait(self.pending_timeout(pending_S))
+                self.serve(ready_S | pending_S, pending_S)
+            else:
+                #transfer one burst on the links with packets waiting
+                self.transfer_shard(k)
             #terminate
             if self.stop:
-                print (threading.currentThread().getName() + ': Ending')
                 return
@@ -1,15 +1,195 @@
 import queue
 import threading
+import collections
 import re
 import ast
+import struct
+import sys
+import time
+from array import array
+import logging
+import dv_matrix
 from operator import itemgetter
 
+logger = logging.getLogger('network')
+
+## readiness set shared by the interfaces of one node, so that the node's
+# thread can sleep until one of its interfaces has traffic
+class Notifier:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.ready_S = set()  # keys reported by notify() since the last wait()
+        self.woken = False
+
+    ## mark key as ready and wake up the waiting thread
+    # @param key - value identifying the interface that received a packet
+    def notify(self, key):
+        with self.cond:
+            self.ready_S.add(key)
+            self.cond.notify()
+
+    ## wake up the waiting thread without marking anything ready (e.g. on stop)
+    def wake(self):
+        with self.cond:
+            self.woken = True
+            self.cond.notify()
+
+    ## block until some key is ready, wake() is called or timeout expires
+    # @param timeout - seconds to wait, None to wait forever
+    # @return set of keys that became ready since the last call
+    def wait(self, timeout=None):
+        with self.cond:
+            if not self.ready_S and not self.woken:
+                self.cond.wait(timeout)
+            ready_S = self.ready_S
+            self.ready_S = set()
+            self.woken = False
+            return ready_S
+
+
+## queue.Queue that can move a batch of packets under one lock acquisition
+class BatchQueue(queue.Queue):
+    ## remove up to max_n items without blocking
+    # @return list of items, empty if the queue is empty
+    def get_many(self, max_n):
+        with self.mutex:
+            n = min(max_n, self._qsize())
+            item_L = [self._get() for _ in range(n)]
+            if n:
+                self.not_full.notify(n)
+            return item_L
+
+    ## add as many items as fit without blocking
+    # @return number of items added from the front of item_L
+    def put_many(self, item_L):
+        with self.mutex:
+            n = len(item_L)
+            if self.maxsize > 0:
+                n = min(n, self.maxsize - self._qsize())
+            for j in range(n):
+                self._put(item_L[j])
+            if n:
+                self.unfinished_tasks += n
+                self.not_empty.notify(n)
+            return n
+
+
+## Single-producer/single-consumer packet queue with the BatchQueue interface.
+# Each interface queue has exactly one producer (a node or a link) and one
+# consumer, and deque.append()/popleft() are atomic, so no lock or condition
+# variable is needed. Bounded by maxsize (0 means unlimited): only the producer
+# adds, so a length check before adding cannot be invalidated by the consumer.
+# An occasional second producer (e.g. the main thread calling send_routes())
+# is still safe, it can only overshoot maxsize by a packet.
+class RingBuffer:
+    ## seconds between checks while a blocking put() waits for room
+    poll_interval = 0.0005
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.queue = collections.deque()
+
+    def qsize(self):
+        return len(self.queue)
+
+    def empty(self):
+        return not self.queue
+
+    def full(self):
+        return 0 < self.maxsize <= len(self.queue)
+
+    ## add an item
+    # @param block - if True wait for room, otherwise raise queue.Full when full
+    def put(self, item, block=True):
+        if self.maxsize > 0:
+            while len(self.queue) >= self.maxsize:
+                if not block:
+                    raise queue.Full
+                time.sleep(self.poll_interval)
+        self.queue.append(item)
+
+    ## remove the oldest item without blocking
+    # @param block - ignored, the consumer never waits; raises queue.Empty when empty
+    def get(self, block=False):
+        try:
+            return self.queue.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    ## remove up to max_n items without blocking
+    # @return list of items, empty if the queue is empty
+    def get_many(self, max_n):
+        popleft = self.queue.popleft
+        n = min(max_n, len(self.queue)) #more may arrive meanwhile, never fewer
+        return [popleft() for _ in range(n)]
+
+    ## add as many items as fit without blocking
+    # @return number of items added from the front of item_L
+    def put_many(self, item_L):
+        n = len(item_L)
+        if self.maxsize > 0:
+            n = max(0, min(n, self.maxsize - len(self.queue)))
+        self.queue.extend(item_L[:n] if n < len(item_L) else item_L)
+        return n
+
+
+## counters of the packets passing through one interface queue
+class QueueStats:
+    __slots__ = ('enqueued', 'dequeued', 'dropped', 'max_depth')
+
+    def __init__(self):
+        self.enqueued = 0   #packets put into the queue
+        self.dequeued = 0   #packets taken out of the queue
+        self.dropped = 0    #packets that did not fit (queue.Full)
+        self.max_depth = 0  #most packets waiting at once
+
+    ## record n packets added to queue q and m that did not fit
+    def count_put(self, q, n, m=0):
+        self.enqueued += n
+        self.dropped += m
+        depth = len(q.queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
 ## wrapper class for a queue of packets
 class Interface:
+    ## queue implementations, see queue_impl
+    queue_class_D = {'queue': BatchQueue, 'ring': RingBuffer}
+
     ## @param maxsize - the maximum size of the queue storing packets
-    def __init__(self, maxsize=0):
-        self.in_queue = queue.Queue(maxsize)
-        self.out_queue = queue.Queue(maxsize)
+    # @param queue_impl - 'queue' for locked queue.Queue based queues, safe with any
+    #  number of threads, or 'ring' for lock-free single-producer/single-consumer RingBuffers
+    def __init__(self, maxsize=0, queue_impl='queue'):
+        if queue_impl not in self.queue_class_D:
+            raise Exception('Unknown queue_impl option: %s' % queue_impl)
+        self.in_queue = self.queue_class_D[queue_impl](maxsize)
+        self.out_queue = self.queue_class_D[queue_impl](maxsize)
+        self.in_stats = QueueStats()
+        self.out_stats = QueueStats()
+        #notifiers signalled on put, as (notifier, key) pairs - see watch()
+        self.in_watch = None
+        self.out_watch = None
+        #largest packet in bytes the attached link carries, None for no limit; set by link_3.Link
+        self.mtu = None
+
+    ## counters of both queues
+    # @return {'in': {counter: value}, 'out': {counter: value}}
+    def stats(self):
+        return {'in': self.in_stats.as_dict(), 'out': self.out_stats.as_dict()}
+
+    ## register a notifier to be signalled whenever a packet is put into a queue
+    # @param in_or_out - use 'in' or 'out' interface
+    # @param notifier - object with a notify(key) method, usually a Notifier
+    # @param key - value passed to notifier.notify()
+    def watch(self, in_or_out, notifier, key):
+        if in_or_out == 'in':
+            self.in_watch = (notifier, key)
+        else:
+            self.out_watch = (notifier, key)
 
     ##get packet from the queue interface
     # @param in_or_out - use 'in' or 'out' interface
@@ -19,15 +199,30 @@ class Interface:
                 pkt_S = self.in_queue.get(False)
                 # if pkt_S is not None:
                 #     print('getting packet from the IN queue')
+                self.in_stats.dequeued += 1
                 return pkt_S
             else:
                 pkt_S = self.out_queue.get(False)
                 # if pkt_S is not None:
                 #     print('getting packet from the OUT queue')
+                self.out_stats.dequeued += 1
                 return pkt_S
         except queue.Empty:
             return None
 
+    ##get up to max_n packets from the queue interface
+    # @param in_or_out - use 'in' or 'out' interface
+    # @param max_n - largest number of packets to return
+    # @return list of packets, empty if none are waiting
+    def get_many(self, in_or_out, max_n):
+        if in_or_out == 'in':
+            pkt_L = self.in_queue.get_many(max_n)
+            self.in_stats.dequeued += len(pkt_L)
+        else:
+            pkt_L = self.out_queue.get_many(max_n)
+            self.out_stats.dequeued += len(pkt_L)
+        return pkt_L
+
     ##put the packet into the interface queue
     # @param pkt - Packet to be inserted into the queue
     # @param in_or_out - use 'in' or 'out' interface
@@ -35,14 +230,82 @@ class Interface:
     def put(self, pkt, in_or_out, block=False):
         if in_or_out == 'out':
             # print('putting packet in the OUT queue')
-            self.out_queue.put(pkt, block)
+            q, stats, watch = self.out_queue, self.out_stats, self.out_watch
         else:
             # print('putting packet in the IN queue')
-            self.in_queue.put(pkt, block)
+            q, stats, watch = self.in_queue, self.in_stats, self.in_watch
+        try:
+            q.put(pkt, block)
+        except queue.Full:
+            stats.dropped += 1
+            raise
+        stats.count_put(q, 1)
+        if watch is not None:
+            watch[0].notify(watch[1])
+
+    ##put as many packets as fit into the interface queue without blocking
+    # @param pkt_L - list of packets to be inserted into the queue
+    # @param in_or_out - use 'in' or 'out' interface
+    # @return number of packets inserted from the front of pkt_L; the rest did not fit
+    def put_many(self, pkt_L, in_or_out):
+        if in_or_out == 'out':
+            q, stats, watch = self.out_queue, self.out_stats, self.out_watch
+        else:
+            q, stats, watch = self.in_queue, self.in_stats, self.in_watch
+        n = q.put_many(pkt_L)
+        stats.count_put(q, n, len(pkt_L) - n)
+        if n and watch is not None:
+            watch[0].notify(watch[1])
+        return n
+
+
+## Interns node names: every name maps to one shared string object, so that
+# routing and forwarding table lookups compare by identity, and to a small
+# integer id used by the binary routing update encoding
+class NodeRegistry:
+    def __init__(self):
+        self.id_D = {}      # {name: id}
+        self.name_L = []    # id -> name
+        self.field_D = {}   # {zero-padded address field: name}
+        self.lock = threading.Lock()
+
+    ## @return the canonical string object for name, registering it if needed
+    def intern(self, name):
+        if name not in self.id_D:
+            self.id_of(name)
+        return self.name_L[self.id_D[name]]
+
+    ## @return the integer id of name, registering it if needed
+    def id_of(self, name):
+        node_id = self.id_D.get(name)
+        if node_id is None:
+            with self.lock:
+                node_id = self.id_D.get(name)
+                if node_id is None:
+                    node_id = len(self.name_L)
+                    self.name_L.append(sys.intern(str(name)))
+                    self.id_D[name] = node_id
+        return node_id
+
+    ## @return the name registered under node_id
+    def name_of(self, node_id):
+        return self.name_L[node_id]
+
+    ## parse a zero-padded address field, caching the result per field
+    def from_field(self, field):
+        name = self.field_D.get(field)
+        if name is None:
+            name = self.intern(field.lstrip('0'))
+            self.field_D[field] = name
+        return name
+
+## registry shared by all nodes in this process
+node_registry = NodeRegistry()
 
 
 ## Implements a network layer packet.
 class NetworkPacket:
+    __slots__ = ('dst', 'prot_S', 'data_S')
     ## packet encoding lengths
     dst_S_length = 5
     prot_S_length = 1
@@ -75,7 +338,7 @@ class NetworkPacket:
     # @param byte_S: byte string representation of the packet
     @classmethod
     def from_byte_S(self, byte_S):
-        dst = byte_S[0 : NetworkPacket.dst_S_length].strip('0')
+        dst = node_registry.from_field(byte_S[0 : NetworkPacket.dst_S_length])
         prot_S = byte_S[NetworkPacket.dst_S_length : NetworkPacket.dst_S_length + NetworkPacket.prot_S_length]
         if prot_S == '1':
             prot_S = 'data'
@@ -93,218 +356,509 @@ class NetworkPacket:
 class Host:
 
     ##@param addr: address of this node represented as an integer
-    def __init__(self, addr):
-        self.addr = addr
-        self.intf_L = [Interface()]
+    # @param event_driven: if True the thread sleeps until a packet arrives instead of polling
+    # @param pass_objects: if True enqueue NetworkPacket objects rather than byte strings
+    # @param queue_impl: interface queue implementation, 'queue' or 'ring' (see Interface)
+    def __init__(self, addr, event_driven=False, pass_objects=False, queue_impl='queue'):
+        self.addr = node_registry.intern(addr)
+        self.pass_objects = pass_objects
+        self.intf_L = [Interface(queue_impl=queue_impl)]
+        self.notifier = None
+        if event_driven:
+            self.notifier = Notifier()
+            self.intf_L[0].watch('in', self.notifier, 0)
+        self.receive_listener = None #called with (host, packet) for every packet received
         self.stop = False #for thread termination
 
+    ## thread termination flag; setting it wakes up an event-driven thread
+    @property
+    def stop(self):
+        return self._stop
+
+    @stop.setter
+    def stop(self, value):
+        self._stop = value
+        if value and self.notifier is not None:
+            self.notifier.wake()
+
     ## called when printing the object
     def __str__(self):
         return self.addr
 
+    ## counters of the host's interface
+    def stats(self):
+        return {'interfaces': [intf.stats() for intf in self.intf_L]}
+
     ## create a packet and enqueue for transmission
     # @param dst: destination address for the packet
     # @param data_S: data being transmitted to the network layer
     def udt_send(self, dst, data_S):
         p = NetworkPacket(dst, 'data', data_S)
-        print('%s: sending packet "%s"' % (self, p))
-        self.intf_L[0].put(p.to_byte_S(), 'out') #send packets always enqueued successfully
+        logger.debug('%s: sending packet "%s"', self, p)
+        self.intf_L[0].put(p if self.pass_objects else p.to_byte_S(), 'out') #send packets always enqueued successfully
 
     ## receive packet from the network layer
+    # @return the received packet, or None if nothing was waiting
     def udt_receive(self):
         pkt_S = self.intf_L[0].get('in')
         if pkt_S is not None:
-            print('%s: received packet "%s"' % (self, pkt_S))
+            logger.debug('%s: received packet "%s"', self, pkt_S)
+            if self.receive_listener is not None:
+                self.receive_listener(self, pkt_S)
+        return pkt_S
 
     ## thread target for the host to keep receiving data
     def run(self):
-        print (threading.currentThread().getName() + ': Starting')
+        logger.debug('%s: Starting', threading.current_thread().name)
         while True:
-            #receive data arriving to the in interface
-            self.udt_receive()
+            if self.notifier is not None:
+                #sleep until a packet arrives, then drain the interface
+                self.notifier.wait()
+                while self.udt_receive() is not None:
+                    pass
+            else:
+                #receive data arriving to the in interface
+                self.udt_receive()
             #terminate
             if(self.stop):
-                print (threading.currentThread().getName() + ': Ending')
+                logger.debug('%s: Ending', threading.current_thread().name)
                 return
 
 
 
 ## Implements a multi-interface router
 class Router:
+    ## route cost meaning "unreachable", unless a router is given a smaller one
+    infinity = 65535
 
     ##@param name: friendly router name for debugging
     # @param cost_D: cost table to neighbors {neighbor: {interface: cost}}
     # @param max_queue_size: max queue length (passed to Interface)
-    def __init__(self, name, cost_D, max_queue_size):
-        self.stop = False #for thread termination
-        self.name = name
+    # @param event_driven: if True the thread sleeps until a packet arrives instead of polling
+    # @param route_encoding: wire format of routing updates, 'text' or 'binary'
+    # @param pass_objects: if True enqueue NetworkPacket objects rather than byte strings
+    # @param burst_size: max packets taken from one interface per visit
+    # @param incremental_updates: if True triggered updates only carry routes whose cost changed
+    # @param refresh_interval: seconds between periodic full table updates, None to disable
+    # @param coalesce_window: seconds to collect route changes before advertising them, None to send at once
+    # @param horizon_mode: 'none', 'split_horizon' (do not advertise routes back to the
+    #  neighbor they were learned from) or 'poisoned_reverse' (advertise them as unreachable)
+    # @param use_dv_matrix: if True keep neighbor vectors in a NumPy dv_matrix.DistanceMatrix
+    # @param queue_impl: interface queue implementation, 'queue' or 'ring' (see Interface)
+    # @param infinity: route cost meaning "unreachable", None for Router.infinity; as in RIP,
+    #  keep it just above the longest path cost, so that after a partition routers count
+    #  up to it in a few exchanges (see topology.route_infinity)
+    def __init__(self, name, cost_D, max_queue_size, event_driven=False, route_encoding='text',
+                 pass_objects=False, burst_size=1, incremental_updates=False, refresh_interval=None,
+                 coalesce_window=None, horizon_mode='none', use_dv_matrix=False, queue_impl='queue',
+                 infinity=None):
+        if horizon_mode not in ('none', 'split_horizon', 'poisoned_reverse'):
+            raise Exception('%s: unknown horizon_mode option: %s' % (name, horizon_mode))
+        if infinity is not None:
+            if not 1 < infinity <= Router.infinity:
+                raise Exception('%s: infinity must be between 2 and %d, got %s' % (name, Router.infinity, infinity))
+            self.infinity = infinity
+        self.name = node_registry.intern(name)
+        self.horizon_mode = horizon_mode
+        self.coalesce_window = coalesce_window
+        self.coalesce_deadline = None #when the pending triggered update goes out
+        self.incremental_updates = incremental_updates
+        self.refresh_interval = refresh_interval
+        self.burst_size = burst_size
+        self.route_encoding = route_encoding
+        self.pass_objects = pass_objects
         #create a list of interfaces
-        self.intf_L = [Interface(max_queue_size) for _ in range(len(cost_D))]
+        self.intf_L = [Interface(max_queue_size, queue_impl) for _ in range(len(cost_D))]
+        self.notifier = None
+        if event_driven:
+            self.notifier = Notifier()
+            for i, intf in enumerate(self.intf_L):
+                intf.watch('in', self.notifier, i)
+        self.stop = False #for thread termination
+        #wait for room in a full out queue; engines running every node on one thread
+        #clear it, since nothing could drain the queue meanwhile, and a full queue drops the packet
+        self.block_on_full = True
         #save neighbors and interfeces on which we connect to them
-        self.cost_D = cost_D    # {neighbor: {interface: cost}}
+        self.cost_D = {node_registry.intern(n): intf_D for n, intf_D in cost_D.items()} # {neighbor: {interface: cost}}
         self.cost_D.update({self.name:{0:0}})
+        #neighbor index, kept in step with cost_D by set_link_cost()
+        self.nbr_intf_D = {}    # {neighbor: interface}
+        self.intf_nbr_L = [None] * len(self.intf_L)     # interface -> neighbor
+        self.intf_cost_A = array('l', [0] * len(self.intf_L)) # interface -> link cost
+        for neighbor, intf_D in self.cost_D.items():
+            if neighbor == self.name:
+                continue
+            for intf, cost in intf_D.items():
+                self.nbr_intf_D[neighbor] = intf
+                self.intf_nbr_L[intf] = neighbor
+                self.intf_cost_A[intf] = cost
         #TODO: set up the routing table for connected hosts
         self.rt_tbl_D = {}      # {destination: {router: cost}}
-        for key, value in cost_D.items():
+        for key, value in self.cost_D.items():
             # print("Key"+key)
-            for key1, value1 in cost_D[key].items():
+            for key1, value1 in self.cost_D[key].items():
                 self.rt_tbl_D.update({key:{self.name:value1}})
-
-        print('%s: Initialized routing table' % self)
-        self.print_routes()
+        self.fib_D = {}         # {destination: interface}, compiled from rt_tbl_D
+        self.compile_fib()
+        self.ctrl_sent_count = 0 #routing updates sent, used for convergence detection
+        self.ctrl_sent_bytes = 0 #RouteMessage payload bytes sent
+        self.ctrl_recv_count = 0 #routing updates received
+        self.forward_count = 0  #data packets forwarded
+        self.no_route_count = 0 #data packets dropped for lack of a route
+        self.route_change_count = 0 #routing table entries changed
+        self.update_time = 0.0  #seconds spent in update_routes()
+        self.adv_D = {}         # {interface: {destination: cost}} last advertised on each interface
+        self.nbr_vec_D = {}     # {neighbor: {destination: cost}} last distance vector from each neighbor
+        self.down_S = set()     # interfaces whose link has failed
+        self.ctrl_lock = threading.RLock() #serializes control plane changes across threads
+        self.timer_listener = None #called with the router when a timer is set, see timers_changed()
+        self.forward_listener = None #called with (router, packet) for every data packet forwarded
+        self.dv = dv_matrix.DistanceMatrix(self) if use_dv_matrix else None
+        self.set_clock(time.monotonic)
+
+        logger.debug('%s: Initialized routing table', self)
+        self.print_routes(logging.DEBUG)
 
 
     ## called when printing the object
     def __str__(self):
         return self.name
 
+    ## thread termination flag; setting it wakes up an event-driven thread
+    @property
+    def stop(self):
+        return self._stop
+
+    @stop.setter
+    def stop(self, value):
+        self._stop = value
+        if value and self.notifier is not None:
+            self.notifier.wake()
+
 
     ## look through the content of incoming interfaces and
     # process data and control packets
     def process_queues(self):
         for i in range(len(self.intf_L)):
-            pkt_S = None
-            #get packet from interface i
-            pkt_S = self.intf_L[i].get('in')
-            #if packet exists make a forwarding decision
-            if pkt_S is not None:
+            self.process_interface(i)
+
+    ## process a batch of up to burst_size packets waiting on an incoming interface
+    # @param i Interface number to read from
+    # @return number of packets processed
+    def process_interface(self, i):
+        #get packets from interface i
+        pkt_L = self.intf_L[i].get_many('in', self.burst_size)
+        #for each packet make a forwarding decision
+        for pkt_S in pkt_L:
+            if isinstance(pkt_S, NetworkPacket):
+                p = pkt_S #already parsed by a node passing objects
+            else:
                 p = NetworkPacket.from_byte_S(pkt_S) #parse a packet out
-                if p.prot_S == 'data':
-                    self.forward_packet(p,i)
-                elif p.prot_S == 'control':
-                    self.update_routes(p, i)
-                else:
-                    raise Exception('%s: Unknown packet type in packet %s' % (self, p))
+            if p.prot_S == 'data':
+                self.forward_packet(p,i)
+            elif p.prot_S == 'control':
+                self.update_routes(p, i)
+            else:
+                raise Exception('%s: Unknown packet type in packet %s' % (self, p))
+        return len(pkt_L)
 
 
     ## forward the packet according to the routing table
     #  @param p Packet to forward
     #  @param i Incoming interface number for packet p
     def forward_packet(self, p, i):
-        dest = NetworkPacket.to_byte_S(p)[:NetworkPacket.dst_S_length+NetworkPacket.prot_S_length-1].strip("0")
-        # print("Router %s forwarding traffic destined to %s" % (self.name, str(dest)))
-        # print("Packet before: "+str(NetworkPacket.to_byte_S(p)))
-        match_dest = list(k for k in self.rt_tbl_D.keys() if k == dest)
-        match_dicts_keys = []
-        for j in match_dest:
-            for key,value in self.rt_tbl_D[j].items():
-                match_dicts_keys.append([j,key,value])
-        best_router = min(match_dicts_keys,key=itemgetter(2))[1]
-        # print("Best route to %s through %s" % (str(dest),str(best_router)))
-        interface = None
+        # print("Router %s forwarding traffic destined to %s" % (self.name, str(p.dst)))
+        interface = self.fib_D.get(p.dst)
+        if interface is None:
+            self.no_route_count += 1
+            logger.warning('Error: No route was found from router: %s to %s', self.name, p.dst)
+            return
         try:
-            if best_router == self.name:
-                interface = next (iter (self.cost_D[dest].keys()))
-            else:
-                interface = next (iter (self.cost_D[best_router].keys()))
-        except KeyError:
-            print("Error: No route was found from router: "+self.name+" to "+dest+" through router "+best_router)
-        # print("Forward packet to %s on iterface %s" % (best_router,str(interface)))
-        # print(self.name+" MATCHING DICT:"+str(match_dicts_keys))
-        try:
-            # TODO: Here you will need to implement a lookup into the
-            # forwarding table to find the appropriate outgoing interface
-            # for now we assume the outgoing interface is 1
-            self.intf_L[interface].put(p.to_byte_S(), 'out', True)
-            # print('%s: forwarding packet "%s" from interface %d to %d' % (self, p, i, 1))
+            self.intf_L[interface].put(p if self.pass_objects else p.to_byte_S(), 'out', self.block_on_full)
+            self.forward_count += 1
+            if self.forward_listener is not None:
+                self.forward_listener(self, p)
+            # print('%s: forwarding packet "%s" from interface %d to %d' % (self, p, i, interface))
         except queue.Full:
-            print('%s: packet "%s" lost on interface %d' % (self, p, i))
+            logger.warning('%s: packet "%s" lost on interface %d', self, p, i)
             pass
 
+    ## rebuild the forwarding table from the routing table, so that the
+    # data path is a single lookup of the destination in fib_D
+    def compile_fib(self):
+        fib_D = {}
+        for dest, route_D in self.rt_tbl_D.items():
+            (best_router, cost) = min(route_D.items(), key=itemgetter(1))
+            if cost >= self.infinity:
+                continue #unreachable
+            #directly connected destinations are reached on their own interface
+            neighbor = dest if best_router == self.name else best_router
+            if neighbor in self.nbr_intf_D:
+                fib_D[dest] = self.nbr_intf_D[neighbor]
+        # print("%s: forwarding table %s" % (self.name, fib_D))
+        self.fib_D = fib_D
+
+
+    ## set the time source used for timers, e.g. a simulator's virtual clock
+    # @param clock: function returning the current time in seconds
+    def set_clock(self, clock):
+        self.clock = clock
+        self.refresh_deadline = None
+        if self.refresh_interval is not None:
+            self.refresh_deadline = clock() + self.refresh_interval
+
+    ## time at which check_timers() next has work to do, None if no timer is set
+    def next_deadline(self):
+        deadline_L = [d for d in (self.refresh_deadline, self.coalesce_deadline) if d is not None]
+        return min(deadline_L) if deadline_L else None
+
+    ## True while route changes are waiting for the coalescing window to close
+    def has_pending_updates(self):
+        return self.coalesce_deadline is not None
+
+    ## run the timers that are due: coalesced triggered updates and periodic full table updates
+    def check_timers(self):
+        now = self.clock()
+        with self.ctrl_lock:
+            if self.coalesce_deadline is not None and now >= self.coalesce_deadline:
+                self.coalesce_deadline = None
+                self.send_triggered_updates()
+            if self.refresh_deadline is not None and now >= self.refresh_deadline:
+                self.refresh_deadline = now + self.refresh_interval
+                for intf in self.interface_list():
+                    self.send_routes(intf)
+
+    ## advertise route changes on every interface, or start the coalescing
+    # window so that further changes go out in the same advertisement
+    def trigger_updates(self):
+        if self.coalesce_window is None:
+            self.send_triggered_updates()
+        elif self.coalesce_deadline is None:
+            self.coalesce_deadline = self.clock() + self.coalesce_window
+            self.timers_changed()
+
+    ## a timer was set outside of check_timers(), make whoever runs the router notice
+    def timers_changed(self):
+        if self.notifier is not None:
+            self.notifier.wake() #recompute the wait timeout
+        if self.timer_listener is not None:
+            self.timer_listener(self)
+
+    def send_triggered_updates(self):
+        for intf in self.interface_list():
+            self.send_routes(intf, not self.incremental_updates)
+
+    ## interfaces on which routing updates are sent
+    def interface_list(self):
+        return [i for i in range(len(self.intf_L)) if i not in self.down_S]
 
     ## send out route update
     # @param i Interface number on which to send out a routing update
-    def send_routes(self, i):
-        # TODO: Send out a routing table update
-        #create a routing table update packet
-        rm = RouteMessage(self.name, self.rt_tbl_D)
-        payload = rm.to_byte_S()
-        p = NetworkPacket(0, 'control', payload)
-        try:
-            print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-            self.intf_L[i].put(p.to_byte_S(), 'out', True)
-        except queue.Full:
-            print('%s: packet "%s" lost on interface %d' % (self, p, i))
-            pass
+    # @param full: if False only send routes whose cost changed since the
+    # last update on this interface, and nothing if none did
+    def send_routes(self, i, full=True):
+        with self.ctrl_lock:
+            adv_D = self.adv_D.setdefault(i, {})
+            neighbor = self.neighbor_on(i)
+            routes_D = {}
+            for dest, route_D in self.rt_tbl_D.items():
+                (via, cost) = min(route_D.items(), key=itemgetter(1))
+                if via == neighbor and self.horizon_mode != 'none':
+                    #route learned from the neighbor on this interface
+                    if self.horizon_mode == 'split_horizon':
+                        #neighbors merge updates entry by entry, so a route advertised
+                        #before is withdrawn once rather than just left out
+                        if adv_D.get(dest, self.infinity) < self.infinity:
+                            routes_D[dest] = {via: self.infinity}
+                            adv_D[dest] = self.infinity
+                        continue
+                    route_D = {via: self.infinity} #poisoned reverse
+                    cost = self.infinity
+                if full or adv_D.get(dest) != cost:
+                    routes_D[dest] = route_D
+                    adv_D[dest] = cost
+        if not routes_D:
+            return
+        for p in self.route_packets(routes_D, self.intf_L[i].mtu):
+            try:
+                logger.debug('%s: sending routing update "%s" from interface %d', self, p, i)
+                self.intf_L[i].put(p if self.pass_objects else p.to_byte_S(), 'out', self.block_on_full)
+                self.ctrl_sent_count += 1
+                self.ctrl_sent_bytes += len(p.data_S)
+            except queue.Full:
+                logger.warning('%s: packet "%s" lost on interface %d', self, p, i)
+                pass
+
+    ## create routing table update packets carrying routes_D, splitting the
+    # routes until each packet fits the MTU; neighbors merge updates entry by
+    # entry, so the parts need not arrive together. A single route that does
+    # not fit is sent anyway and dropped by the link.
+    # @param mtu: largest packet in bytes, None for no limit
+    # @return list of NetworkPackets
+    def route_packets(self, routes_D, mtu=None):
+        payload = RouteMessage(self.name, routes_D, self.route_encoding).to_byte_S()
+        header_length = NetworkPacket.dst_S_length + NetworkPacket.prot_S_length
+        if mtu is None or header_length + len(payload) <= mtu or len(routes_D) == 1:
+            return [NetworkPacket(0, 'control', payload)]
+        dest_L = list(routes_D)
+        half = len(dest_L) // 2
+        return self.route_packets({dest: routes_D[dest] for dest in dest_L[:half]}, mtu) + \
+               self.route_packets({dest: routes_D[dest] for dest in dest_L[half:]}, mtu)
 
 
     ## forward the packet according to the routing table
     #  @param p Packet containing routing information
     def update_routes(self, p, i):
+        start = time.perf_counter()
+        with self.ctrl_lock:
+            self.ctrl_recv_count += 1
+            packet = RouteMessage.from_byte_S(p.data_S)
+            logger.debug('%s: Received routing update %s from interface %d', self, packet, i)
+            if i in self.down_S:
+                return #arrived over a link that has since failed
+            sender_address = packet[0]
+            routes = packet[1]
+            if self.dv is not None:
+                change_flag = self.apply_route_changes(self.dv.apply(i, routes))
+            else:
+                #remember the sender's distance vector, then redo Bellman-Ford for its entries
+                vec_D = self.nbr_vec_D.setdefault(sender_address, {})
+                for dest, route_D in routes.items():
+                    vec_D[dest] = int(min(route_D.values()))
+                change_flag = self.recompute_routes(routes.keys())
+            if change_flag:
+                self.compile_fib()
+                self.trigger_updates()
+            self.update_time += time.perf_counter() - start
+
+    ## write routes computed by the distance matrix into rt_tbl_D
+    # @param change_L list of (destination, next hop, cost)
+    # @return True if anything changed
+    def apply_route_changes(self, change_L):
+        for dest, via, cost in change_L:
+            self.rt_tbl_D[dest] = {via: cost}
+        self.route_change_count += len(change_L)
+        return len(change_L) > 0
+
+    ## pick the cheapest next hop for each destination from the direct links
+    # and the neighbors' distance vectors; the current next hop wins ties
+    # @param dest_L destinations to recompute
+    # @return True if rt_tbl_D changed
+    def recompute_routes(self, dest_L):
         change_flag = False
-        packet = RouteMessage.from_byte_S(NetworkPacket.to_byte_S(p)[NetworkPacket.dst_S_length+NetworkPacket.prot_S_length:])
-        # print("Packet before: "+str(NetworkPacket.to_byte_S(p)))
-        print('%s: Received routing update %s from interface %d' % (self, packet, i))
-        sender_address = packet[0]
-        # print("INTERFACE COST %d, %s= %d" % (i,sender_address,self.cost_D[sender_address][i]))
-        routes = packet[1]
-        # print(type(routes),routes)
-        # for key, value in routes.items():
-        #     print(key, value)
-        # print("sender address: "+str(sender_address))
-        # print("self.rt: "+str(self.rt_tbl_D))
-        neighbor_path = None
-        first_route = None
-        if sender_address in self.rt_tbl_D.keys():
-            for intf in self.rt_tbl_D[sender_address].keys():
-                neighbor_path = {sender_address:{intf:self.rt_tbl_D[sender_address][intf]}}
-       # neighbor_path = list(self.rt_tbl_D[x] for x in self.rt_tbl_D if sender_address in self.rt_tbl_D.keys() and self.rt_tbl_D[sender_address] != [])
-        if self.name in routes.keys():
-            for intf in routes[self.name].keys():
-                first_route = {self.name:{intf:routes[self.name][intf]}}
-        # print("First Route:"+str(first_route)+" neighbor_path: "+str(neighbor_path))
-        for route in routes.items():
-            for key, value in route[1].items():
-                route = [route[0],key,value]
-            existing_route = None
-            sender_path = None
-            if route[0] in self.rt_tbl_D.keys():
-                existing_route = self.rt_tbl_D[route[0]]
-            if sender_address in self.rt_tbl_D.keys():
-                sender_path = int(next(iter(self.rt_tbl_D[sender_address].values())))
-            # print("EXISTING ROUTE: "+str(existing_route))
-            # print("Route"+str(route))
-            if existing_route is None:
-                # print(">>>>>CHANGING %s for %s<<<<<<" % (route[0], self.name))
-                self.rt_tbl_D.update({route[0]:{sender_address:self.cost_D[sender_address][i]+int(route[2])}})
-                change_flag = True
-            elif int(sender_path+int(route[2])) < int(next (iter (existing_route.values()))):
-                # print("existing route %s updated to %s" %(str(existing_route), str(next (iter (existing_route.values())))))
-                print(">>>>>CHANGING %s for %s<<<<<<" % (route[0], self.name))
-                self.rt_tbl_D.update({route[0]:{sender_address:int(sender_path+int(route[2]))}})
+        for dest in dest_L:
+            if dest == self.name:
+                continue
+            existing_route = self.rt_tbl_D.get(dest)
+            best_via = None
+            best_cost = self.infinity
+            if existing_route is not None:
+                best_via = min(existing_route.items(), key=itemgetter(1))[0]
+                best_cost = self.route_cost(dest, best_via)
+            for via in [self.name] + list(self.nbr_vec_D):
+                cost = self.route_cost(dest, via)
+                if cost < best_cost:
+                    best_via = via
+                    best_cost = cost
+            if best_via is None:
+                continue #never reachable, nothing to record
+            route_D = {best_via: best_cost}
+            if existing_route != route_D:
+                self.rt_tbl_D[dest] = route_D
+                self.route_change_count += 1
                 change_flag = True
-            else:
-                # print(">>>>>PASS %s for %s<<<<<<" % (route[0],self.name))
-                pass
+        return change_flag
+
+    ## cost of reaching dest through next hop via (self.name for the direct link)
+    def route_cost(self, dest, via):
+        if via == self.name:
+            cost = self.direct_cost(dest)
+            return self.infinity if cost is None else cost
+        link_cost = self.direct_cost(via)
+        vec_D = self.nbr_vec_D.get(via)
+        if link_cost is None or vec_D is None or dest not in vec_D:
+            return self.infinity
+        return min(self.infinity, link_cost + vec_D[dest])
+
+    ## cost of the direct link to a neighbor, None if dest is not a neighbor or the link is down
+    def direct_cost(self, dest):
+        intf = self.nbr_intf_D.get(dest)
+        if intf is None or intf in self.down_S:
+            return None
+        return self.intf_cost_A[intf]
+
+    ## router counters and the counters of its interfaces
+    def stats(self):
+        return {'forwarded': self.forward_count,
+                'no_route': self.no_route_count,
+                'ctrl_sent': self.ctrl_sent_count,
+                'ctrl_sent_bytes': self.ctrl_sent_bytes,
+                'ctrl_received': self.ctrl_recv_count,
+                'route_changes': self.route_change_count,
+                'update_seconds': self.update_time,
+                'interfaces': [intf.stats() for intf in self.intf_L]}
+
+    ## neighbor connected to interface i, None if not known
+    def neighbor_on(self, i):
+        return self.intf_nbr_L[i]
+
+    ## recompute every route after the link on interface i changed, and advertise the changes
+    def reroute(self, i):
+        if self.dv is not None:
+            self.dv.update_link(i)
+            change_flag = self.apply_route_changes(self.dv.relax_all())
+        else:
+            change_flag = self.recompute_routes(list(self.rt_tbl_D))
         if change_flag:
-            interface_list = set()
-            for k,d in self.cost_D.items():
-                for intf, value in d.items():
-                    interface_list.add(intf)
-            # print("INTERFACE LIST"+str(interface_list))
-            for intf in interface_list:
-                self.send_routes(int(intf))
+            self.compile_fib()
+            self.trigger_updates()
+
+    ## the link on interface i failed: forget what was learned over it and route around it
+    def link_down(self, i):
+        with self.ctrl_lock:
+            logger.info('%s: link on interface %d is down', self, i)
+            self.down_S.add(i)
+            self.adv_D.pop(i, None)
+            self.nbr_vec_D.pop(self.neighbor_on(i), None)
+            if self.dv is not None:
+                self.dv.forget(i)
+            self.reroute(i)
+
+    ## the link on interface i was restored: use it again and send the neighbor our table
+    def link_up(self, i):
+        with self.ctrl_lock:
+            logger.info('%s: link on interface %d is up', self, i)
+            self.down_S.discard(i)
+            self.adv_D.pop(i, None)
+            self.reroute(i)
+            self.send_routes(i)
+
+    ## change the cost of the link on interface i
+    def set_link_cost(self, i, cost):
+        with self.ctrl_lock:
+            logger.info('%s: link on interface %d now costs %d', self, i, cost)
+            self.cost_D[self.neighbor_on(i)][i] = cost
+            self.intf_cost_A[i] = cost
+            self.reroute(i)
 
     ## Print routing table
-    def print_routes(self):
-        print('%s: routing table' % self)
+    # @param level: logging level of the table; nothing is built if it is disabled
+    def print_routes(self, level=logging.INFO):
+        if not logger.isEnabledFor(level):
+            return
+        line_L = ['%s: routing table' % self]
         #TODO: print the routes as a two dimensional table for easy inspection
         # Currently the function just prints the route table as a dictionary
         columns = list()
         for key, value in self.rt_tbl_D.items():
             columns.insert(len(columns), key)
-        print("|======", end="")
-        for i in range(len(columns)):
-            print("|======", end="")
-        print("|")
+        rule = "|======" * (len(columns) + 1) + "|"
+        line_L.append(rule)
         dest = "| "+self.name+"   |"
         for i in columns:
             dest += " "+(str(i))+"   |"
-        print(dest)
-        print("|======", end="")
-        for i in range(len(columns)):
-            print("|======", end="")
-        print("|")
+        line_L.append(dest)
+        line_L.append(rule)
         src = ""
         row_keys = set()
         for i in set(self.rt_tbl_D.keys()):
@@ -321,40 +875,62 @@ class Router:
                         src += " ~    |"
                 else:
                     src += " ~    |"
-            print(src)
+            line_L.append(src)
             src = ""
-        print("|======", end="")
-        for i in range(len(columns)):
-            print("|======", end="")
-        print("|")
-        print(self.rt_tbl_D)
-        print()
+        line_L.append(rule)
+        line_L.append(str(self.rt_tbl_D))
+        line_L.append('')
+        logger.log(level, '\n'.join(line_L))
 
 
     ## thread target for the host to keep forwarding data
     def run(self):
-        print (threading.currentThread().getName() + ': Starting')
+        logger.debug('%s: Starting', threading.current_thread().name)
         while True:
-            self.process_queues()
+            if self.notifier is not None:
+                #sleep until some interfaces have traffic or a timer is due,
+                #then drain only the interfaces with traffic
+                timeout = None
+                deadline = self.next_deadline()
+                if deadline is not None:
+                    timeout = max(0, deadline - self.clock())
+                for i in self.notifier.wait(timeout):
+                    while self.process_interface(i):
+                        pass
+            else:
+                self.process_queues()
+            self.check_timers()
             if self.stop:
-                print (threading.currentThread().getName() + ': Ending')
+                logger.debug('%s: Ending', threading.current_thread().name)
                 return
 
 class RouteMessage:
     ## packet encoding lengths
     name_length = 5
-
-    ##@param dst_addr: address of the destination host
+    ## binary encoding: a header (magic, version, router, entry count) followed
+    # by fixed-size (destination, next hop, cost) records. Version 1 carries
+    # zero-padded names, version 2 (written) carries node_registry ids.
+    binary_magic = 0xff #never the first character of the text encoding
+    binary_version = 2
+    header_struct = struct.Struct('!BB%dsH' % name_length)
+    record_struct = struct.Struct('!%ds%dsI' % (name_length, name_length))
+    header_v2_struct = struct.Struct('!BBHH')
+    record_v2_struct = struct.Struct('!HHI')
+
+    ##@param name: name of the router sending the update
     # @param data_S: the routing table from the router
-    # @param prot_S: upper layer protocol for the packet (data, or control)
-    def __init__(self, name, data_S):
+    # @param encoding: 'text' or 'binary' wire format used by to_byte_S
+    def __init__(self, name, data_S, encoding='text'):
         self.name = name
         self.data_S = data_S
+        self.encoding = encoding
 
     def __str__(self):
         return self.to_byte_S()
 
     def to_byte_S(self):
+        if self.encoding == 'binary':
+            return self.to_binary_S()
         byte_S = str(self.name).zfill(self.name_length)
         columns = list()
         rows = list()
@@ -371,15 +947,53 @@ class RouteMessage:
         # print("RouteMessage: "+byte_S)
         return byte_S
 
+    ## pack the routing table into the binary encoding; the bytes are carried
+    # one per character so the result can be used as a packet payload
+    def to_binary_S(self):
+        id_of = node_registry.id_of
+        records = []
+        for dest, route_D in self.data_S.items():
+            for router, cost in route_D.items():
+                records.append(self.record_v2_struct.pack(id_of(dest), id_of(router), int(cost)))
+        header = self.header_v2_struct.pack(self.binary_magic, self.binary_version,
+                                            id_of(self.name), len(records))
+        return (header + b''.join(records)).decode('latin-1')
+
+    ## parse either encoding of a route update
+    # @return (router name, {destination: {router: cost}})
     @classmethod
     def from_byte_S(self, byte_S):
-        name = byte_S[0 : RouteMessage.name_length].strip('0')
+        if byte_S and ord(byte_S[0]) == RouteMessage.binary_magic:
+            return self.from_binary_S(byte_S)
+        name = node_registry.from_field(byte_S[0 : RouteMessage.name_length])
         data_S = byte_S[RouteMessage.name_length : ]
         data_S = re.findall(r"\(([^)]+)\)", data_S)
         new_dict = dict()
+        intern = node_registry.intern
         for route in data_S:
             divide = [x.strip(' ()\'') for x in route.split(",")]
-            new_dict[divide[0]]=({divide[1]: divide[2]})
+            new_dict[intern(divide[0])]=({intern(divide[1]): int(divide[2])})
         # print("Name:"+str(name)+" New Dict: "+str(new_dict))
         # print("TYPE BEFORE"+str(type(new_dict)))
         return name, new_dict
+
+    ## parse the binary encoding, dispatching on its version field
+    @classmethod
+    def from_binary_S(self, byte_S):
+        buf = byte_S.encode('latin-1')
+        version = buf[1]
+        new_dict = dict()
+        if version == 2:
+            name_of = node_registry.name_of
+            magic, version, name, count = RouteMessage.header_v2_struct.unpack_from(buf)
+            for dest, router, cost in RouteMessage.record_v2_struct.iter_unpack(buf[RouteMessage.header_v2_struct.size:]):
+                new_dict[name_of(dest)] = {name_of(router): cost}
+            return name_of(name), new_dict
+        elif version == 1:
+            intern = node_registry.intern
+            magic, version, name, count = RouteMessage.header_struct.unpack_from(buf)
+            for dest, router, cost in RouteMessage.record_struct.iter_unpack(buf[RouteMessage.header_struct.size:]):
+                new_dict[intern(dest.rstrip(b'\0').decode())] = {intern(router.rstrip(b'\0').decode()): cost}
+            return intern(name.rstrip(b'\0').decode()), new_dict
+        else:
+            raise Exception('%s: unknown binary RouteMessage version: %d' % (self.__name__, version))
@@ -0,0 +1,40 @@
+import json
+import network_3 as network
+import link_3 as link
+
+## Snapshots of the counters kept by hosts, routers, interfaces and links,
+# for finding the bottleneck of a run.
+
+## collect the counters of every object in the network
+# @param object_L: hosts, routers and link layers of the network
+# @return {'hosts': {name: stats}, 'routers': {name: stats}, 'links': {link name: stats}}
+def snapshot(object_L):
+    snap_D = {'hosts': {}, 'routers': {}, 'links': {}}
+    for obj in object_L:
+        if isinstance(obj, network.Host):
+            snap_D['hosts'][str(obj)] = obj.stats()
+        elif isinstance(obj, network.Router):
+            snap_D['routers'][str(obj)] = obj.stats()
+        elif isinstance(obj, link.LinkLayer):
+            for l in obj.link_L:
+                snap_D['links'][str(l)] = l.stats()
+    return snap_D
+
+## write a snapshot of the network's counters to a JSON file
+def dump(object_L, path):
+    with open(path, 'w') as f:
+        json.dump(snapshot(object_L), f, indent=1)
+
+## the interface queues that dropped the most packets or grew the longest
+# @param snap_D: result of snapshot()
+# @param n: number of queues to return
+# @return list of (node, interface, 'in' or 'out', counters), worst first
+def busiest_queues(snap_D, n=10):
+    queue_L = []
+    for kind in ('hosts', 'routers'):
+        for name, stats_D in snap_D[kind].items():
+            for i, intf_D in enumerate(stats_D['interfaces']):
+                for in_or_out, counter_D in intf_D.items():
+                    queue_L.append((name, i, in_or_out, counter_D))
+    queue_L.sort(key=lambda q: (q[3]['dropped'], q[3]['max_depth'], q[3]['enqueued']), reverse=True)
+    return queue_L[:n]
@@ -0,0 +1,116 @@
+import heapq
+import itertools
+import network_3 as network
+import topology
+
+## Reference all-pairs shortest paths for a network, used to check what the
+# distance-vector routing tables should converge to and to pre-seed routers
+# ("warm start") when only the data plane is of interest.
+
+## build a directed graph of the network from its links and the routers' cost tables
+# @param link_layer: link_3.LinkLayer holding the links; failed links are left out
+# @return ({name: node}, {name: [(neighbor name, cost)]}) - only routers have outgoing edges
+def build_graph(link_layer):
+    node_D = {}
+    graph_D = {}
+    for link in link_layer.link_L:
+        for (node_a, node_a_intf, node_b, node_b_intf) in link.dir_L:
+            node_D[str(node_a)] = node_a
+            graph_D.setdefault(str(node_a), [])
+            if not link.up or not isinstance(node_a, network.Router):
+                continue #hosts do not forward
+            cost = node_a.cost_D[str(node_b)][node_a_intf]
+            graph_D[str(node_a)].append((str(node_b), cost))
+    return node_D, graph_D
+
+## build the same graph from a topology dict (see topology.py), for networks whose
+# objects are not all in this process
+# @return {name: [(neighbor name, cost)]}
+def build_topology_graph(topo):
+    graph_D = {name: [] for name in topo.get('hosts', []) + topo.get('routers', [])}
+    router_S = set(topo.get('routers', []))
+    for (node_1, intf_1, node_2, intf_2, cost_1, cost_2, delay) in topology.resolve_links(topo):
+        if node_1 in router_S:
+            graph_D[node_1].append((node_2, cost_1))
+        if node_2 in router_S:
+            graph_D[node_2].append((node_1, cost_2))
+    return graph_D
+
+## Dijkstra from one source
+# @return {destination: (cost, first hop)}; the first hop of a neighbor reached
+# over its direct link is the neighbor itself
+def shortest_paths(graph_D, source):
+    path_D = {source: (0, source)}
+    seq = itertools.count() #tie breaker so the heap never compares names
+    heap_L = [(cost, next(seq), neighbor, neighbor) for neighbor, cost in graph_D.get(source, [])]
+    heapq.heapify(heap_L)
+    while heap_L:
+        (cost, _, node, first_hop) = heapq.heappop(heap_L)
+        if node in path_D:
+            continue
+        path_D[node] = (cost, first_hop)
+        for neighbor, link_cost in graph_D.get(node, []):
+            if neighbor not in path_D:
+                heapq.heappush(heap_L, (cost + link_cost, next(seq), neighbor, first_hop))
+    return path_D
+
+## shortest paths from every router
+# @return {router name: {destination: (cost, first hop)}}
+def all_pairs(link_layer):
+    node_D, graph_D = build_graph(link_layer)
+    return {name: shortest_paths(graph_D, name)
+            for name, node in node_D.items() if isinstance(node, network.Router)}
+
+## compare the routers' routing tables with the shortest paths
+# @return list of mismatch descriptions, empty if every table is correct
+def verify_routes(link_layer):
+    node_D, graph_D = build_graph(link_layer)
+    router_L = [node for node in node_D.values() if isinstance(node, network.Router)]
+    return verify_tables(graph_D, {str(router): router.rt_tbl_D for router in router_L},
+                         min([router.infinity for router in router_L], default=None))
+
+## compare routing tables with the shortest paths of a graph
+# @param graph_D: graph from build_graph() or build_topology_graph()
+# @param table_D: {router name: routing table {destination: {next hop: cost}}}
+# @param infinity: route cost the routers use for "unreachable", None for network.Router.infinity;
+#  any cost from it up counts as unreachable
+# @return list of mismatch descriptions, empty if every table is correct
+def verify_tables(graph_D, table_D, infinity=None):
+    error_L = []
+    if infinity is None:
+        infinity = network.Router.infinity
+    for name, rt_tbl_D in table_D.items():
+        path_D = shortest_paths(graph_D, name)
+        for dest in set(path_D) | set(rt_tbl_D):
+            expected = path_D[dest][0] if dest in path_D else infinity
+            route_D = rt_tbl_D.get(dest)
+            actual = min(min(route_D.values()), infinity) if route_D else infinity
+            if actual != expected:
+                error_L.append('%s: route to %s costs %s, shortest path costs %s' % (name, dest, actual, expected))
+    return error_L
+
+## warm start: fill every router's routing table, neighbor vectors and
+# forwarding table with the shortest paths, so no routing updates are needed
+def seed_routes(link_layer):
+    node_D, graph_D = build_graph(link_layer)
+    pairs_D = all_pairs(link_layer)
+    for name, path_D in pairs_D.items():
+        router = node_D[name]
+        with router.ctrl_lock:
+            router.rt_tbl_D = {}
+            for dest, (cost, first_hop) in path_D.items():
+                via = router.name if first_hop == dest else first_hop
+                router.rt_tbl_D[dest] = {via: cost}
+            #the neighbors' vectors are their own shortest paths
+            router.nbr_vec_D = {}
+            if router.dv is not None:
+                router.dv = network.dv_matrix.DistanceMatrix(router)
+            for neighbor, intf in router.nbr_intf_D.items():
+                if neighbor not in pairs_D or intf in router.down_S:
+                    continue
+                vec_D = {dest: cost for dest, (cost, first_hop) in pairs_D[neighbor].items()}
+                if router.dv is not None:
+                    router.dv.apply(intf, {dest: {neighbor: cost} for dest, cost in vec_D.items()})
+                else:
+                    router.nbr_vec_D[neighbor] = vec_D
+            router.compile_fib()
@@ -0,0 +1,311 @@
+import collections
+import logging
+import multiprocessing
+import multiprocessing.connection
+import sys
+import threading
+import time
+import network_3 as network
+import async_runtime
+import convergence
+import route_oracle
+import sim_logging
+import topology
+
+logger = logging.getLogger('sharded_sim')
+
+## Runs one topology across several processes, so a large network is not
+# limited to the one core the GIL allows. Every worker process builds and runs
+# (on an async_runtime.AsyncRuntime) the routers and hosts of its partition.
+# A link between partitions is carried over a pipe between the two workers:
+# packets leaving the interface at one end are serialized with to_byte_S(),
+# sent in batches and put into the in queue of the interface at the other end,
+# with the same queue limits and counters as a local link. A coordinator in
+# the parent process starts routing, sends packets, detects quiescence and
+# collects the results.
+
+##configuration parameters
+n_workers = 4
+timeout = 120
+route_encoding = 'binary'
+
+## split a topology into n partitions of connected routers
+# @return {node name: partition number}; hosts go with their router
+def partition(topo, n):
+    router_L = topo.get('routers', [])
+    neighbor_D = collections.defaultdict(list)
+    for l in topo.get('links', []):
+        (node_1, node_2) = l['nodes']
+        neighbor_D[node_1].append(node_2)
+        neighbor_D[node_2].append(node_1)
+    #breadth-first order keeps neighboring routers in the same partition
+    router_S = set(router_L)
+    order_L = []
+    seen_S = set()
+    for root in router_L:
+        if root in seen_S:
+            continue
+        seen_S.add(root)
+        queue_L = collections.deque([root])
+        while queue_L:
+            node = queue_L.popleft()
+            order_L.append(node)
+            for neighbor in neighbor_D[node]:
+                if neighbor in router_S and neighbor not in seen_S:
+                    seen_S.add(neighbor)
+                    queue_L.append(neighbor)
+    part_D = {}
+    for k, router in enumerate(order_L):
+        part_D[router] = k * n // len(order_L)
+    for host in topo.get('hosts', []):
+        router_L = [node for node in neighbor_D[host] if node in router_S]
+        part_D[host] = part_D[router_L[0]] if router_L else 0
+    return part_D
+
+
+## one worker's end of the links that cross to other partitions
+class Boundary:
+
+    ##@param node_D: nodes of this partition by name
+    # @param port_L: (link number, node name, interface, peer partition) of each crossing link
+    # @param conn_D: {peer partition: Connection}
+    # @param pass_objects: if True in queues carry NetworkPacket objects
+    def __init__(self, node_D, port_L, conn_D, pass_objects):
+        self.conn_D = conn_D
+        self.pass_objects = pass_objects
+        self.port_D = {}        # {link number: (interface, peer partition)}
+        self.notifier = network.Notifier()
+        self.sent_count = 0     # packets taken out of boundary out queues
+        self.recv_count = 0     # packets received from peers
+        self.stop = False
+        for (link_id, name, intf, peer) in port_L:
+            interface = node_D[name].intf_L[intf]
+            self.port_D[link_id] = (interface, peer)
+            interface.watch('out', self.notifier, link_id)
+
+    ## thread target: ship packets leaving boundary interfaces to the peers
+    def send_loop(self):
+        while not self.stop:
+            batch_D = collections.defaultdict(list) # {peer: [(link number, [packet])]}
+            for link_id in self.notifier.wait():
+                (interface, peer) = self.port_D[link_id]
+                pkt_L = interface.get_many('out', sys.maxsize)
+                if not pkt_L:
+                    continue
+                self.sent_count += len(pkt_L)
+                batch_D[peer].append((link_id, [p.to_byte_S() if isinstance(p, network.NetworkPacket) else p
+                                                for p in pkt_L]))
+            for peer, batch_L in batch_D.items():
+                try:
+                    self.conn_D[peer].send(batch_L)
+                except OSError:
+                    logger.warning('partition %d has shut down, %d packets lost', peer, sum(len(b[1]) for b in batch_L))
+
+    ## thread target: put packets arriving from the peers into the boundary in queues
+    def recv_loop(self):
+        conn_L = list(self.conn_D.values())
+        while conn_L and not self.stop:
+            for conn in multiprocessing.connection.wait(conn_L, 0.1):
+                try:
+                    batch_L = conn.recv()
+                except EOFError:
+                    conn_L.remove(conn) #the peer has shut down
+                    continue
+                for link_id, pkt_L in batch_L:
+                    if self.pass_objects:
+                        pkt_L = [network.NetworkPacket.from_byte_S(p) for p in pkt_L]
+                    self.port_D[link_id][0].put_many(pkt_L, 'in') #what does not fit is lost
+                    self.recv_count += len(pkt_L)
+
+
+## worker process: build a partition and serve the coordinator's requests until told to stop
+# @param ctrl_conn: Connection to the coordinator
+# @param conn_D: {peer partition: Connection} for the crossing links
+# @param options: build options, see ShardedSimulation
+def worker(topo, part_D, part, ctrl_conn, conn_D, options):
+    sim_logging.configure(options.pop('log_level'))
+    #intern every name in the same order in every process, so node ids
+    #(used by the binary route encoding) agree across partitions
+    for name in topo.get('hosts', []) + topo.get('routers', []):
+        network.node_registry.intern(name)
+    node_S = {name for name, p in part_D.items() if p == part}
+    object_L, node_D, link_layer = topology.build(topo, node_S=node_S, **options)
+    port_L = []
+    for link_id, (node_1, intf_1, node_2, intf_2, cost_1, cost_2, delay) in enumerate(topology.resolve_links(topo)):
+        if (node_1 in node_S) != (node_2 in node_S):
+            if node_1 in node_S:
+                port_L.append((link_id, node_1, intf_1, part_D[node_2]))
+            else:
+                port_L.append((link_id, node_2, intf_2, part_D[node_1]))
+    boundary = Boundary(node_D, port_L, conn_D, options.get('pass_objects', False))
+    received_L = [] # (host, data) of the data packets received
+    def received(host, pkt):
+        if not isinstance(pkt, network.NetworkPacket):
+            pkt = network.NetworkPacket.from_byte_S(pkt)
+        if pkt.prot_S == 'data':
+            received_L.append((str(host), pkt.data_S))
+    for obj in object_L:
+        if isinstance(obj, network.Host):
+            obj.receive_listener = received
+    runtime = async_runtime.AsyncRuntime()
+    runtime.add_objects(object_L)
+    thread_L = [runtime.start_thread(),
+                threading.Thread(name='boundary send', target=boundary.send_loop),
+                threading.Thread(name='boundary receive', target=boundary.recv_loop)]
+    for t in thread_L[1:]:
+        t.start()
+    router_L = [obj for obj in object_L if isinstance(obj, network.Router)]
+
+    while True:
+        request = ctrl_conn.recv()
+        command = request[0]
+        if command == 'start_routing':
+            for router in router_L:
+                for i in router.interface_list():
+                    router.send_routes(i)
+            ctrl_conn.send(None)
+        elif command == 'send':
+            node_D[request[1]].udt_send(request[2], request[3])
+            ctrl_conn.send(None)
+        elif command == 'status':
+            ctrl_conn.send({'quiet': convergence.queues_empty(object_L) and not convergence.updates_pending(object_L),
+                            'ctrl_sent': convergence.control_messages(object_L),
+                            'boundary_sent': boundary.sent_count,
+                            'boundary_recv': boundary.recv_count})
+        elif command == 'results':
+            ctrl_conn.send({'tables': {str(r): {dest: dict(route_D) for dest, route_D in r.rt_tbl_D.items()}
+                                       for r in router_L},
+                            'stats': {str(obj): obj.stats() for obj in object_L if hasattr(obj, 'stats')},
+                            'received': list(received_L)})
+        elif command == 'stop':
+            runtime.shutdown()
+            boundary.stop = True
+            boundary.notifier.wake()
+            for t in thread_L:
+                t.join()
+            ctrl_conn.send(None)
+            return
+        else:
+            raise Exception('worker %d: unknown request %s' % (part, command))
+
+
+## coordinator of a sharded run, with the udt_send/send_routes style API of a single-process one
+class ShardedSimulation:
+
+    ##@param topo: topology dict, see topology.py
+    # @param n_workers: number of worker processes
+    # @param log_level: logging level inside the workers
+    # @param options: topology.build options (pass_objects, burst_size, Router options...)
+    def __init__(self, topo, n_workers, log_level=logging.WARNING, **options):
+        self.topo = topo
+        self.infinity = options.get('infinity') or topology.route_infinity(topo)
+        self.part_D = partition(topo, n_workers)
+        n_workers = max(self.part_D.values()) + 1 if self.part_D else 0
+        options['log_level'] = log_level
+        #one pipe between every two partitions that share a link
+        pipe_D = {} # {(partition, partition): (Connection, Connection)}
+        for l in topo.get('links', []):
+            (p_1, p_2) = sorted(self.part_D[node] for node in l['nodes'])
+            if p_1 != p_2 and (p_1, p_2) not in pipe_D:
+                pipe_D[(p_1, p_2)] = multiprocessing.Pipe()
+        self.ctrl_L = []
+        self.process_L = []
+        for part in range(n_workers):
+            conn_D = {}
+            for (p_1, p_2), (conn_1, conn_2) in pipe_D.items():
+                if p_1 == part:
+                    conn_D[p_2] = conn_1
+                elif p_2 == part:
+                    conn_D[p_1] = conn_2
+            parent_conn, child_conn = multiprocessing.Pipe()
+            p = multiprocessing.Process(name='worker %d' % part, target=worker,
+                                        args=(topo, self.part_D, part, child_conn, conn_D, dict(options)))
+            p.start()
+            self.ctrl_L.append(parent_conn)
+            self.process_L.append(p)
+
+    ## send a request to one worker and return its reply
+    def request(self, part, *request):
+        self.ctrl_L[part].send(request)
+        return self.ctrl_L[part].recv()
+
+    ## send a request to every worker
+    # @return list of replies
+    def broadcast(self, *request):
+        for conn in self.ctrl_L:
+            conn.send(request)
+        return [conn.recv() for conn in self.ctrl_L]
+
+    ## every router advertises its table on every interface
+    def start_routing(self):
+        self.broadcast('start_routing')
+
+    ## send a packet from host src to dst
+    def udt_send(self, src, dst, data_S):
+        self.request(self.part_D[src], 'send', src, dst, data_S)
+
+    ## wait until no worker has packets queued or updates pending and every
+    # packet sent over a crossing link has arrived, in two polls settle_time apart
+    # @return (converged, seconds until the last activity, routing updates sent meanwhile)
+    def wait_for_convergence(self, timeout=60, settle_time=0.05, poll_interval=0.005):
+        start = time.monotonic()
+        start_messages = None
+        last = None
+        last_active = start
+        while True:
+            status_L = self.broadcast('status')
+            now = time.monotonic()
+            messages = sum(s['ctrl_sent'] for s in status_L)
+            if start_messages is None:
+                start_messages = messages
+            snapshot = (messages, sum(s['boundary_sent'] for s in status_L), sum(s['boundary_recv'] for s in status_L))
+            quiet = all(s['quiet'] for s in status_L) and snapshot[1] == snapshot[2]
+            if not quiet or snapshot != last:
+                last = snapshot
+                last_active = now
+            elif now - last_active >= settle_time:
+                return True, last_active - start, messages - start_messages
+            if now - start >= timeout:
+                return False, now - start, messages - start_messages
+            time.sleep(poll_interval)
+
+    ## routing tables, counters and received packets of every worker
+    # @return {'tables': {router: rt_tbl_D}, 'stats': {node: stats}, 'received': [(host, data)]}
+    def results(self):
+        result_D = {'tables': {}, 'stats': {}, 'received': []}
+        for reply in self.broadcast('results'):
+            result_D['tables'].update(reply['tables'])
+            result_D['stats'].update(reply['stats'])
+            result_D['received'].extend(reply['received'])
+        return result_D
+
+    ## compare the routing tables with the shortest paths
+    # @return list of mismatch descriptions, empty if every table is correct
+    def verify_routes(self):
+        return route_oracle.verify_tables(route_oracle.build_topology_graph(self.topo), self.results()['tables'],
+                                          self.infinity)
+
+    ## stop the workers and wait for them to exit
+    def shutdown(self):
+        self.broadcast('stop')
+        for p in self.process_L:
+            p.join()
+
+
+if __name__ == '__main__':
+    sim_logging.configure(logging.INFO)
+    topo = topology.grid(10, 10)
+    start = time.perf_counter()
+    sim = ShardedSimulation(topo, n_workers, pass_objects=True, burst_size=16, route_encoding=route_encoding,
+                            incremental_updates=True, coalesce_window=0.005, horizon_mode='poisoned_reverse')
+    sim.start_routing()
+    converged, converge_time, messages = sim.wait_for_convergence(timeout)
+    print("Converged routing tables" if converged else "Routing tables did NOT converge")
+    print("Convergence took %.3f s and %d routing updates on %d workers" % (converge_time, messages, n_workers))
+    for error in sim.verify_routes():
+        print(error)
+    sim.udt_send('H1', 'H100', 'MESSAGE_FROM_H1')
+    sim.wait_for_convergence(timeout)
+    print("Received: %s" % sim.results()['received'])
+    sim.shutdown()
+    print("Finished in %.3f s" % (time.perf_counter() - start))
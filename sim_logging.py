@@ -0,0 +1,52 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+
+## Logging setup for the simulations. network_3 and link_3 log through the
+# 'network' and 'link' loggers: per-packet messages at DEBUG, routing tables
+# at INFO, lost packets at WARNING. Messages are formatted lazily, so with the
+# level above DEBUG the data path does no string building for them.
+
+## listener of the buffered sink, None if logging is not buffered
+_listener = None
+
+## QueueHandler that queues records unformatted; the stock one formats each
+# record on the thread that logs it, leaving only the writing to the listener
+class _RawQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+## set up logging for a simulation run
+# @param level: lowest level written, e.g. logging.DEBUG for every packet, logging.WARNING for benchmarks
+# @param buffered: if True log calls only queue the record and a background thread
+#  formats and writes it, so slow output does not hold up the simulation; the
+#  arguments are formatted later, so they must not be changed after logging
+# @param stream: where to write, sys.stdout by default
+# @param fmt: logging format string; the default writes just the message, like print did
+def configure(level=logging.INFO, buffered=False, stream=None, fmt='%(message)s'):
+    global _listener
+    shutdown()
+    handler = logging.StreamHandler(sys.stdout if stream is None else stream)
+    handler.setFormatter(logging.Formatter(fmt))
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    if buffered:
+        record_Q = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(record_Q, handler)
+        _listener.start()
+        root.addHandler(_RawQueueHandler(record_Q))
+    else:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+## write out everything still buffered and stop the background thread
+def shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown)
@@ -1,90 +1,203 @@
 import network_3 as network
 import link_3 as link
+import event_sim
+import async_runtime
+import convergence
+import route_oracle
+import network_stats
+import sim_logging
+import logging
 import threading
-from time import sleep
 import sys
 
 ##configuration parameters
 router_queue_size = 0 #0 means unlimited
-simulation_time = 2   #give the network sufficient time to execute transfers
-routing_table_time = 12
+timeout = 60          #give up waiting for the network to go quiet after this many seconds
+event_driven = True   #sleep until traffic arrives instead of busy-polling interfaces
+route_encoding = 'text' #'text' or 'binary' routing update messages
+pass_objects = True   #carry parsed packets through interface queues instead of byte strings
+burst_size = 16       #max packets moved per interface or link direction in one visit
+engine = 'events'     #'events' runs in virtual time on one thread, 'threads' runs a thread per object,
+                      #'asyncio' runs every object as a coroutine on one event loop
+link_delay = 0.001    #link propagation delay in seconds (virtual time on the 'events' engine)
+link_bandwidth = None #link transmission rate in bits per second, None to transmit instantly
+link_mtu = None       #largest packet in bytes a link carries, None for no limit
+incremental_updates = True #triggered routing updates only carry changed routes
+refresh_interval = 30 #seconds between periodic full routing table updates
+coalesce_window = 0.005 #seconds to collect route changes into one routing update
+horizon_mode = 'poisoned_reverse' #'none', 'split_horizon' or 'poisoned_reverse'
+use_dv_matrix = False #keep distance vectors in NumPy arrays (needs numpy)
+route_infinity = 26   #route cost meaning unreachable; as in RIP, just above the longest path cost (topology.route_infinity of topologies/simulation_3.json)
+warm_start = False    #seed routing tables with shortest paths instead of running distance vector
+test_failure = False  #fail the RB-RD link after the first exchange and send again
+queue_impl = 'ring'   #'ring' for lock-free single-producer/single-consumer interface queues, 'queue' for queue.Queue
+link_workers = 1      #threads moving packets in the link layer ('threads' engine)
+stats_file = None     #write a snapshot of the network counters to this JSON file at the end
+log_level = logging.DEBUG #logging.INFO leaves out the per-packet messages
+buffered_logging = False #write log messages from a background thread
 
 if __name__ == '__main__':
+    sim_logging.configure(log_level, buffered_logging)
     object_L = [] #keeps track of objects, so we can kill their threads at the end
 
     #create network hosts
-    host_1 = network.Host('H1')
+    host_1 = network.Host('H1', event_driven=event_driven, pass_objects=pass_objects, queue_impl=queue_impl)
     object_L.append(host_1)
-    host_2 = network.Host('H2')
+    host_2 = network.Host('H2', event_driven=event_driven, pass_objects=pass_objects, queue_impl=queue_impl)
     object_L.append(host_2)
-    host_3 = network.Host('H3')
+    host_3 = network.Host('H3', event_driven=event_driven, pass_objects=pass_objects, queue_impl=queue_impl)
     object_L.append(host_3)
 
     #create routers and cost tables for reaching neighbors
     cost_D = {'H1': {0: 1}, 'H2': {1: 2}, 'RB': {2: 1}, 'RC':{3: 5}} # {neighbor: {interface: cost}}
     router_a = network.Router(name='RA',
                               cost_D = cost_D,
-                              max_queue_size=router_queue_size)
+                              max_queue_size=router_queue_size,
+                              event_driven=event_driven,
+                              route_encoding=route_encoding,
+                              pass_objects=pass_objects,
+                              burst_size=burst_size,
+                              incremental_updates=incremental_updates,
+                              refresh_interval=refresh_interval,
+                              coalesce_window=coalesce_window,
+                              horizon_mode=horizon_mode,
+                              use_dv_matrix=use_dv_matrix,
+                              queue_impl=queue_impl,
+                              infinity=route_infinity)
     object_L.append(router_a)
 
     cost_D = {'RA': {0: 5}, 'RD': {1: 1}} # {neighbor: {interface: cost}}
     router_b = network.Router(name='RB',
                               cost_D = cost_D,
-                              max_queue_size=router_queue_size)
+                              max_queue_size=router_queue_size,
+                              event_driven=event_driven,
+                              route_encoding=route_encoding,
+                              pass_objects=pass_objects,
+                              burst_size=burst_size,
+                              incremental_updates=incremental_updates,
+                              refresh_interval=refresh_interval,
+                              coalesce_window=coalesce_window,
+                              horizon_mode=horizon_mode,
+                              use_dv_matrix=use_dv_matrix,
+                              queue_impl=queue_impl,
+                              infinity=route_infinity)
     object_L.append(router_b)
 
     cost_D = {'RA': {0: 1}, 'RD': {1: 5}}
     router_c = network.Router(name='RC',
                               cost_D = cost_D,
-                              max_queue_size=router_queue_size)
+                              max_queue_size=router_queue_size,
+                              event_driven=event_driven,
+                              route_encoding=route_encoding,
+                              pass_objects=pass_objects,
+                              burst_size=burst_size,
+                              incremental_updates=incremental_updates,
+                              refresh_interval=refresh_interval,
+                              coalesce_window=coalesce_window,
+                              horizon_mode=horizon_mode,
+                              use_dv_matrix=use_dv_matrix,
+                              queue_impl=queue_impl,
+                              infinity=route_infinity)
     object_L.append(router_c)
 
     cost_D = {'RB': {0: 5}, 'RC': {1: 1}, 'H3': {2: 3}}
     router_d = network.Router(name='RD',
                               cost_D = cost_D,
-                              max_queue_size=router_queue_size)
+                              max_queue_size=router_queue_size,
+                              event_driven=event_driven,
+                              route_encoding=route_encoding,
+                              pass_objects=pass_objects,
+                              burst_size=burst_size,
+                              incremental_updates=incremental_updates,
+                              refresh_interval=refresh_interval,
+                              coalesce_window=coalesce_window,
+                              horizon_mode=horizon_mode,
+                              use_dv_matrix=use_dv_matrix,
+                              queue_impl=queue_impl,
+                              infinity=route_infinity)
     object_L.append(router_d)
 
     #create a Link Layer to keep track of links between network nodes
-    link_layer = link.LinkLayer()
+    link_layer = link.LinkLayer(event_driven=event_driven, burst_size=burst_size, n_workers=link_workers)
     object_L.append(link_layer)
 
     #add all the links - need to reflect the connectivity in cost_D tables above
-    link_layer.add_link(link.Link(host_1, 0, router_a, 0))
-    link_layer.add_link(link.Link(host_2, 0, router_a, 1))
-    link_layer.add_link(link.Link(router_a, 2, router_b, 0))
-    link_layer.add_link(link.Link(router_a, 3, router_c, 0))
-    link_layer.add_link(link.Link(router_b, 1, router_d, 0))
-    link_layer.add_link(link.Link(router_c, 1, router_d, 1))
-    link_layer.add_link(link.Link(router_d, 2, host_3, 0))
-
-    #start all the objects
-    thread_L = []
-    for obj in object_L:
-        thread_L.append(threading.Thread(name=obj.__str__(), target=obj.run))
-
-    for t in thread_L:
-        t.start()
+    link_layer.add_link(link.Link(host_1, 0, router_a, 0, delay=link_delay, bandwidth=link_bandwidth, mtu=link_mtu))
+    link_layer.add_link(link.Link(host_2, 0, router_a, 1, delay=link_delay, bandwidth=link_bandwidth, mtu=link_mtu))
+    link_layer.add_link(link.Link(router_a, 2, router_b, 0, delay=link_delay, bandwidth=link_bandwidth, mtu=link_mtu))
+    link_layer.add_link(link.Link(router_a, 3, router_c, 0, delay=link_delay, bandwidth=link_bandwidth, mtu=link_mtu))
+    link_b_d = link.Link(router_b, 1, router_d, 0, delay=link_delay, bandwidth=link_bandwidth, mtu=link_mtu)
+    link_layer.add_link(link_b_d)
+    link_layer.add_link(link.Link(router_c, 1, router_d, 1, delay=link_delay, bandwidth=link_bandwidth, mtu=link_mtu))
+    link_layer.add_link(link.Link(router_d, 2, host_3, 0, delay=link_delay, bandwidth=link_bandwidth, mtu=link_mtu))
+
+    if engine == 'events':
+        #drive all the objects from one discrete-event scheduler
+        sim = event_sim.Simulator()
+        sim.add_objects(object_L)
+    elif engine == 'asyncio':
+        #one background thread runs the event loop with a coroutine per object
+        sim = None
+        runtime = async_runtime.AsyncRuntime()
+        runtime.add_objects(object_L)
+        thread_L = [runtime.start_thread()]
+    else:
+        sim = None
+        #start all the objects
+        thread_L = []
+        for obj in object_L:
+            thread_L.append(threading.Thread(name=obj.__str__(), target=obj.run))
+
+        for t in thread_L:
+            t.start()
 
     ## compute routing tables
-    router_a.send_routes(2) #one update starts the routing process
-    sleep(routing_table_time)  #let the tables converge
-    print("Converged routing tables")
+    if warm_start:
+        route_oracle.seed_routes(link_layer)
+        print("Seeded routing tables with shortest paths")
+    else:
+        router_a.send_routes(2) #one update starts the routing process
+        #let the tables converge
+        converged, converge_time, messages = convergence.wait_for_convergence(object_L, sim, timeout)
+        print("Converged routing tables" if converged else "Routing tables did NOT converge")
+        print("Convergence took %.3f s and %d routing updates" % (converge_time, messages))
+    for error in route_oracle.verify_routes(link_layer):
+        print(error)
     for obj in object_L:
         if str(type(obj)) == "<class 'network_3.Router'>":
             obj.print_routes()
 
     #send packet from host 1 to host 2
     host_1.udt_send('H3', 'MESSAGE_FROM_H1')
-    sleep(simulation_time)
+    convergence.wait_for_convergence(object_L, sim, timeout) #wait for delivery
     host_3.udt_send('H1', 'REPLY_MESSAGE_FROM_H3')
-    sleep(simulation_time)
-
-
-    #join all threads
-    for o in object_L:
-        o.stop = True
-    for t in thread_L:
-        t.join()
-
-    print("All simulation threads joined")
+    convergence.wait_for_convergence(object_L, sim, timeout)
+
+    if test_failure:
+        #H1 -> H3 traffic uses RB-RD, take it down and wait for routing to recover
+        converged, converge_time, messages = convergence.measure_reconvergence(
+            object_L, lambda: link_layer.fail_link(link_b_d), sim, timeout)
+        print("Reconvergence after link failure took %.3f s and %d routing updates" % (converge_time, messages))
+        for error in route_oracle.verify_routes(link_layer):
+            print(error)
+        for obj in object_L:
+            if str(type(obj)) == "<class 'network_3.Router'>":
+                obj.print_routes()
+        host_1.udt_send('H3', 'MESSAGE_FROM_H1_AFTER_FAILURE')
+        convergence.wait_for_convergence(object_L, sim, timeout)
+
+    if stats_file is not None:
+        network_stats.dump(object_L, stats_file)
+
+    if engine == 'events':
+        print("Simulation finished after %d events, %.3f s of virtual time" % (sim.event_count, sim.now))
+    else:
+        #join all threads
+        for o in object_L:
+            o.stop = True
+        if engine == 'asyncio':
+            runtime.shutdown()
+        for t in thread_L:
+            t.join()
+
+        print("All simulation threads joined")
@@ -0,0 +1,238 @@
+import json
+import random
+import sys
+import network_3 as network
+import link_3 as link
+
+## Declarative network topologies.
+#
+# A topology is a dict (stored as JSON) of the form
+#   {"hosts": ["H1", ...],
+#    "routers": ["RA", ...],
+#    "links": [{"nodes": ["H1", "RA"], "cost": 1},
+#              {"nodes": ["RA", "RB"], "costs": [1, 5], "interfaces": [2, 0], "delay": 0.001,
+#               "bandwidth": 1000000, "mtu": 1500},
+#              ...]}
+# "cost" sets both ends, "costs" gives the cost each end's router uses for the link.
+# "interfaces", "delay" (seconds), "bandwidth" (bits per second) and "mtu" (bytes)
+# are optional; interfaces left out are given the lowest free number on each node,
+# in link order.
+
+## longest node name that fits in a NetworkPacket destination field
+max_name_length = network.NetworkPacket.dst_S_length
+
+## read a topology from a JSON file
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+## write a topology to a JSON file
+def save(topo, path):
+    with open(path, 'w') as f:
+        json.dump(topo, f, indent=1)
+
+## check a topology and number the interfaces of every link
+# @return list of (node_1, node_1_intf, node_2, node_2_intf, cost_1, cost_2, delay) per link
+def resolve_links(topo):
+    host_S = set(topo.get('hosts', []))
+    router_S = set(topo.get('routers', []))
+    name_L = list(topo.get('hosts', [])) + list(topo.get('routers', []))
+    if len(set(name_L)) != len(name_L):
+        raise Exception('Duplicate node names in topology')
+    for name in name_L:
+        if not isinstance(name, str) or not 0 < len(name) <= max_name_length or name.startswith('0'):
+            raise Exception('Invalid node name %r: need 1 to %d characters, not starting with 0' % (name, max_name_length))
+    #first pass: check the links and reserve explicitly numbered interfaces
+    used_D = {name: set() for name in name_L} # {node: {interface}}
+    pair_S = set()
+    for l in topo.get('links', []):
+        (node_1, node_2) = l['nodes']
+        for node in (node_1, node_2):
+            if node not in used_D:
+                raise Exception('Link %s-%s: unknown node %s' % (node_1, node_2, node))
+        if node_1 == node_2:
+            raise Exception('Link %s-%s: a node cannot link to itself' % (node_1, node_2))
+        if frozenset((node_1, node_2)) in pair_S:
+            raise Exception('Link %s-%s: only one link is allowed between two nodes' % (node_1, node_2))
+        pair_S.add(frozenset((node_1, node_2)))
+        for node, intf in zip((node_1, node_2), l.get('interfaces', [None, None])):
+            if intf is None:
+                continue
+            if intf in used_D[node]:
+                raise Exception('Link %s-%s: interface %d of %s is already in use' % (node_1, node_2, intf, node))
+            used_D[node].add(intf)
+    #second pass: number the remaining interfaces and collect the costs
+    next_D = {name: 0 for name in name_L} # {node: lowest interface that may be free}
+    link_L = []
+    for l in topo.get('links', []):
+        (node_1, node_2) = l['nodes']
+        intf_L = list(l.get('interfaces', [None, None]))
+        for k, node in enumerate((node_1, node_2)):
+            if intf_L[k] is None:
+                while next_D[node] in used_D[node]:
+                    next_D[node] += 1
+                intf_L[k] = next_D[node]
+                used_D[node].add(intf_L[k])
+        cost_L = l.get('costs', [l.get('cost', 1)] * 2)
+        for cost in cost_L:
+            if not isinstance(cost, int) or not 0 < cost < network.Router.infinity:
+                raise Exception('Link %s-%s: cost must be an integer between 1 and %d' % (node_1, node_2, network.Router.infinity - 1))
+        link_L.append((node_1, intf_L[0], node_2, intf_L[1], cost_L[0], cost_L[1], l.get('delay')))
+    #routers have interfaces 0..n-1 for their n neighbors, hosts have interface 0 only
+    for name, intf_S in used_D.items():
+        if name in host_S and not intf_S <= {0}:
+            raise Exception('Host %s has a single interface 0, but links use %s' % (name, sorted(intf_S)))
+        if name in router_S and intf_S != set(range(len(intf_S))):
+            raise Exception('Router %s: interfaces %s are not numbered 0..%d' % (name, sorted(intf_S), len(intf_S) - 1))
+    return link_L
+
+## RIP-style route infinity for a topology: one more than the cost of the longest
+# path any route can take (every router and the two host links, over the costliest links)
+def route_infinity(topo):
+    cost_L = [cost for (_, _, _, _, cost_1, cost_2, _) in resolve_links(topo) for cost in (cost_1, cost_2)]
+    return min(network.Router.infinity, max(cost_L, default=1) * (len(topo.get('routers', [])) + 1) + 1)
+
+## create the hosts, routers and links of a topology
+# @param link_delay: propagation delay of links that do not set their own
+# @param link_bandwidth: bits per second of links that do not set their own, None to transmit instantly
+# @param link_mtu: MTU in bytes of links that do not set their own, None for no limit
+# @param max_queue_size: router interface queue length (0 means unlimited)
+# @param link_workers: threads moving packets in the link layer
+# @param queue_impl: interface queue implementation, 'queue' or 'ring' (see network_3.Interface)
+# @param node_S: names of the nodes to create, None for all; links to nodes left out
+#  are not created, but routers keep them in their cost tables (see sharded_sim)
+# @param router_kwargs: further network_3.Router options; infinity defaults to route_infinity(topo)
+# @return (object_L, node_D, link_layer): hosts, routers and the link layer in the order
+#  the simulations start them, the nodes by name, and the link layer
+def build(topo, link_delay=0, event_driven=False, pass_objects=False, burst_size=1, max_queue_size=0,
+          link_workers=1, queue_impl='queue', node_S=None, link_bandwidth=None, link_mtu=None, **router_kwargs):
+    link_L = resolve_links(topo)
+    router_kwargs.setdefault('infinity', route_infinity(topo))
+    cost_DD = {name: {} for name in topo.get('routers', [])} # {router: {neighbor: {interface: cost}}}
+    for (node_1, intf_1, node_2, intf_2, cost_1, cost_2, delay) in link_L:
+        if node_1 in cost_DD:
+            cost_DD[node_1][node_2] = {intf_1: cost_1}
+        if node_2 in cost_DD:
+            cost_DD[node_2][node_1] = {intf_2: cost_2}
+    object_L = []
+    node_D = {}
+    for name in topo.get('hosts', []):
+        if node_S is not None and name not in node_S:
+            continue
+        node_D[name] = network.Host(name, event_driven=event_driven, pass_objects=pass_objects, queue_impl=queue_impl)
+        object_L.append(node_D[name])
+    for name in topo.get('routers', []):
+        if node_S is not None and name not in node_S:
+            continue
+        node_D[name] = network.Router(name=name,
+                                      cost_D=cost_DD[name],
+                                      max_queue_size=max_queue_size,
+                                      event_driven=event_driven,
+                                      pass_objects=pass_objects,
+                                      burst_size=burst_size,
+                                      queue_impl=queue_impl,
+                                      **router_kwargs)
+        object_L.append(node_D[name])
+    link_layer = link.LinkLayer(event_driven=event_driven, burst_size=burst_size, n_workers=link_workers)
+    object_L.append(link_layer)
+    for (node_1, intf_1, node_2, intf_2, cost_1, cost_2, delay), l in zip(link_L, topo.get('links', [])):
+        if node_1 not in node_D or node_2 not in node_D:
+            continue
+        link_layer.add_link(link.Link(node_D[node_1], intf_1, node_D[node_2], intf_2,
+                                      delay=link_delay if delay is None else delay,
+                                      bandwidth=l.get('bandwidth', link_bandwidth),
+                                      mtu=l.get('mtu', link_mtu)))
+    return object_L, node_D, link_layer
+
+
+## generators for synthetic topologies; routers are named R1, R2, ... and hosts H1, H2, ...
+
+## start a topology with n routers
+def _routers(n):
+    if len('R%d' % n) > max_name_length:
+        raise Exception('Too many routers for %d character names: %d' % (max_name_length, n))
+    return {'hosts': [], 'routers': ['R%d' % (k + 1) for k in range(n)], 'links': []}
+
+## attach hosts_per_router hosts to each of the given routers
+def _add_hosts(topo, router_L, hosts_per_router, cost=1):
+    for router in router_L:
+        for _ in range(hosts_per_router):
+            host = 'H%d' % (len(topo['hosts']) + 1)
+            if len(host) > max_name_length:
+                raise Exception('Too many hosts for %d character names' % max_name_length)
+            topo['hosts'].append(host)
+            topo['links'].append({'nodes': [host, router], 'cost': cost})
+    return topo
+
+## n routers in a ring, each with hosts_per_router hosts
+def ring(n, hosts_per_router=1, cost=1):
+    topo = _routers(n)
+    r_L = topo['routers']
+    for k in range(n if n > 2 else n - 1): #two routers share one link
+        topo['links'].append({'nodes': [r_L[k], r_L[(k + 1) % n]], 'cost': cost})
+    return _add_hosts(topo, r_L, hosts_per_router)
+
+## rows x cols routers in a grid, each with hosts_per_router hosts
+def grid(rows, cols, hosts_per_router=1, cost=1):
+    topo = _routers(rows * cols)
+    r_L = topo['routers']
+    for r in range(rows):
+        for c in range(cols):
+            if c + 1 < cols:
+                topo['links'].append({'nodes': [r_L[r * cols + c], r_L[r * cols + c + 1]], 'cost': cost})
+            if r + 1 < rows:
+                topo['links'].append({'nodes': [r_L[r * cols + c], r_L[(r + 1) * cols + c]], 'cost': cost})
+    return _add_hosts(topo, r_L, hosts_per_router)
+
+## k-ary fat tree: (k/2)^2 core routers and k pods of k/2 aggregation and k/2 edge
+# routers; every edge router has k/2 hosts
+def fat_tree(k, cost=1):
+    if k < 2 or k % 2:
+        raise Exception('Fat tree arity must be a positive even number, got %s' % k)
+    half = k // 2
+    topo = _routers(half * half + k * k)
+    r_L = topo['routers']
+    core_L = r_L[:half * half]
+    for p in range(k):
+        agg_L = r_L[half * half + p * k:half * half + p * k + half]
+        edge_L = r_L[half * half + p * k + half:half * half + (p + 1) * k]
+        for a, agg in enumerate(agg_L):
+            #aggregation router a connects to core routers a*k/2 .. a*k/2 + k/2 - 1
+            for core in core_L[a * half:(a + 1) * half]:
+                topo['links'].append({'nodes': [agg, core], 'cost': cost})
+            for edge in edge_L:
+                topo['links'].append({'nodes': [edge, agg], 'cost': cost})
+        _add_hosts(topo, edge_L, half)
+    return topo
+
+## n routers with random links: a random spanning tree keeps the graph connected and
+# extra links are added until routers average degree neighbors
+# @param seed: random seed, for repeatable topologies
+def random_graph(n, degree=3, hosts_per_router=1, max_cost=10, seed=None):
+    rng = random.Random(seed)
+    topo = _routers(n)
+    r_L = topo['routers']
+    pair_S = set()
+    def add(a, b):
+        pair_S.add(frozenset((a, b)))
+        topo['links'].append({'nodes': [r_L[a], r_L[b]], 'cost': rng.randint(1, max_cost)})
+    for k in range(1, n):
+        add(k, rng.randrange(k))
+    extra = min(n * degree // 2, n * (n - 1) // 2) - (n - 1)
+    while extra > 0:
+        (a, b) = rng.sample(range(n), 2)
+        if frozenset((a, b)) not in pair_S:
+            add(a, b)
+            extra -= 1
+    return _add_hosts(topo, r_L, hosts_per_router)
+
+
+if __name__ == '__main__':
+    #e.g. python topology.py grid 10 10 > grid_10x10.json
+    generator_D = {'ring': ring, 'grid': grid, 'fat_tree': fat_tree, 'random': random_graph}
+    if len(sys.argv) < 3 or sys.argv[1] not in generator_D:
+        print('usage: %s {%s} size... > topology.json' % (sys.argv[0], '|'.join(generator_D)))
+        sys.exit(1)
+    topo = generator_D[sys.argv[1]](*[int(a) for a in sys.argv[2:]])
+    resolve_links(topo)
+    json.dump(topo, sys.stdout, indent=1)